@@ -1,18 +1,38 @@
+from pydantic import field_validator
 from pydantic_settings import BaseSettings
 from functools import lru_cache
 from urllib.parse import quote
 import os
+import tempfile
 import logging
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
 logger = logging.getLogger(__name__)
 
 class Settings(BaseSettings):
     host_ribetec_printer: str = "192.168.100.5"
     printer_port: int = 9100
+    # Lease entre workers de uvicorn: directorio compartido de archivos de lock
+    printer_lock_dir: str = os.path.join(tempfile.gettempdir(), "ribetec-printer-locks")
+    printer_lock_timeout: float = 30.0  # segundos esperando a que otro worker libere
+    # Control de flujo con ~HS: documentos enviados aún no consumidos (0 = sin control)
+    printer_max_in_flight: int = 2
+    printer_status_poll_interval: float = 0.5  # segundos entre consultas ~HS
+    printer_status_timeout: float = 2.0  # segundos esperando la respuesta de ~HS
+    printer_stall_timeout: float = 60.0  # segundos sin progreso antes de dar los trabajos por fallidos
+    printer_status_max_failures: int = 3  # respuestas ~HS inválidas seguidas antes de desactivar el control
+    printer_status_reprobe_interval: float = 60.0  # segundos sin control de flujo antes de volver a probar ~HS si no respondía
+    printer_state_poll_interval: float = 5.0  # segundos entre consultas ~HS sin trabajos, si hay suscriptores
+    # Cola de impresión: trabajos pendientes permitidos por cliente
+    queue_max_per_client: int = 500
+    # Idempotency-Key en los endpoints de impresión
+    idempotency_max_entries: int = 10000
+    idempotency_ttl: float = 86400.0  # segundos que se recuerda cada clave
+    idempotency_persist_path: str | None = None  # archivo JSON Lines para sobrevivir reinicios
+    # Logging: nivel y fracción de peticiones de impresión con detalle completo en el log
+    log_level: str = "INFO"  # DEBUG, INFO, WARNING, ERROR o CRITICAL
+    request_log_sample_rate: float = 0.1
+    # Objetivo de arranque (import de app.main hasta listo para atender), en ms
+    cold_start_target_ms: float = 500.0
     app_title: str = "Ribetec Printer API"
     app_version: str = "1.0.0"
 
@@ -27,6 +47,16 @@ class Settings(BaseSettings):
     db_name: str | None = os.getenv("DB_NAME")
     db_sslmode: str = os.getenv("DB_SSLMODE", "prefer")
 
+    @field_validator("log_level")
+    @classmethod
+    def _validate_log_level(cls, value: str) -> str:
+        level = value.strip().upper()
+        if level not in ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"):
+            raise ValueError(
+                f"LOG_LEVEL inválido: {value!r} (usa DEBUG, INFO, WARNING, ERROR o CRITICAL)"
+            )
+        return level
+
     # @property
     def resolved_database_url(self) -> str | None:
         """Devuelve DATABASE_URL si existe, si no construye un DSN con DB_*."""
@@ -35,10 +65,10 @@ class Settings(BaseSettings):
 
         if not (self.db_host and self.db_user and self.db_password and self.db_name):
             return None
-        logger.info(f"db_host: {self.db_host}")
-        logger.info(f"db_port: {self.db_port}")
-        logger.info(f"db_name: {self.db_name}")
-        logger.info(f"db_sslmode: {self.db_sslmode}")
+        logger.info(
+            "BD: host=%s port=%s name=%s sslmode=%s",
+            self.db_host, self.db_port, self.db_name, self.db_sslmode,
+        )
         user = quote(self.db_user, safe="")
         password = quote(self.db_password, safe="")
         host = self.db_host
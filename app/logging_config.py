@@ -0,0 +1,74 @@
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Loggers de uvicorn con handlers propios (propagate=False): sin pasar por la cola
+# escribirían en el event loop una línea por petición
+UVICORN_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+_listeners: list[QueueListener] = []
+_root_configured = False
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler que no formatea en el hilo que loguea.
+
+    El QueueHandler estándar formatea el mensaje en prepare() para que el registro
+    sea serializable; aquí la cola es en memoria, así que el formateo (y el I/O)
+    queda para el hilo del QueueListener y no ocupa el event loop.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def _start_listener(handlers: list[logging.Handler]) -> QueueHandler:
+    """Arranca un QueueListener con `handlers` y devuelve el handler que alimenta su cola"""
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+    return _DeferredQueueHandler(log_queue)
+
+
+def _stop_listeners() -> None:
+    """Vacía las colas pendientes al salir"""
+    while _listeners:
+        _listeners.pop().stop()
+
+
+atexit.register(_stop_listeners)
+
+
+def queue_logger_handlers(logger: logging.Logger) -> None:
+    """Pasa los handlers propios de `logger` a un QueueListener (idempotente)"""
+    handlers = [h for h in logger.handlers if not isinstance(h, _DeferredQueueHandler)]
+    if not handlers:
+        return
+    for handler in handlers:
+        logger.removeHandler(handler)
+    logger.addHandler(_start_listener(handlers))
+
+
+def setup_logging(level: str = "INFO") -> None:
+    """
+    Configura el logging de la app una sola vez: handlers detrás de una cola.
+
+    También encola los handlers que uvicorn ya configuró; si uvicorn los configura
+    después de importar la app, volver a llamar en el arranque los encola.
+    """
+    global _root_configured
+    if not _root_configured:
+        _root_configured = True
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        root = logging.getLogger()
+        root.setLevel(level.upper())
+        root.addHandler(_start_listener([stream_handler]))
+    for name in UVICORN_LOGGERS:
+        queue_logger_handlers(logging.getLogger(name))
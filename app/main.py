@@ -1,22 +1,29 @@
+import time
+
+_IMPORT_STARTED = time.perf_counter()
+
+import asyncio
+import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import get_settings
+from app.logging_config import setup_logging
 from app.routers import print_router
 from app.services.ip_service import IpService
-import logging
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
+settings = get_settings()
+setup_logging(settings.log_level)
 logger = logging.getLogger(__name__)
 
 
-settings = get_settings()
 def _startup_update_local_ip():
     logger.info("Actualizando IP local en la BD")
     db_url = settings.resolved_database_url()
-    res = IpService(database_url=db_url).update_ip_local()
+    try:
+        res = IpService(database_url=db_url).update_ip_local()
+    except Exception:
+        logger.exception("Error al actualizar la IP local en la BD")
+        return
     if res:
         logger.info("IP local actualizada en la BD")
     else:
@@ -45,8 +52,21 @@ app.include_router(print_router)
 
 
 @app.on_event("startup")
-def startup_update_local_ip() -> None:
-    _startup_update_local_ip()
+async def startup_update_local_ip() -> None:
+    # Por si uvicorn configuró sus loggers después de importar la app
+    setup_logging(settings.log_level)
+    # La detección de IP y la conexión a la BD corren en segundo plano para no
+    # retrasar la primera petición
+    loop = asyncio.get_running_loop()
+    app.state.ip_update = loop.run_in_executor(None, _startup_update_local_ip)
+
+    elapsed_ms = (time.perf_counter() - _IMPORT_STARTED) * 1000
+    if elapsed_ms > settings.cold_start_target_ms:
+        logger.warning(
+            "Arranque en %.0f ms (objetivo %.0f ms)", elapsed_ms, settings.cold_start_target_ms
+        )
+    else:
+        logger.info("Arranque en %.0f ms", elapsed_ms)
 
 
 @app.get("/", tags=["Health"])
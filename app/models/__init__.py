@@ -9,6 +9,7 @@ from app.models.label import (
     BarcodeType,
     LabelSize,
     TextAlignment,
+    JobPriority,
 )
 
 __all__ = [
@@ -22,4 +23,5 @@ __all__ = [
     "BarcodeType",
     "LabelSize",
     "TextAlignment",
+    "JobPriority",
 ]
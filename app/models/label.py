@@ -25,6 +25,12 @@ class TextAlignment(str, Enum):
     RIGHT = "right"
 
 
+class JobPriority(str, Enum):
+    URGENT = "urgent"    # Se atiende antes que cualquier otro trabajo pendiente
+    NORMAL = "normal"
+    BULK = "bulk"        # Lotes grandes; solo cuando no hay nada más urgente
+
+
 class LabelElement(BaseModel):
     """Elemento base para la etiqueta"""
     x: int = Field(ge=0, description="Posición X en dots (203 dpi = 8 dots/mm)")
@@ -37,6 +43,13 @@ class TextElement(LabelElement):
     font_size: int = Field(default=30, ge=10, le=200)
     bold: bool = False
     alignment: TextAlignment = TextAlignment.LEFT
+    max_width: Optional[int] = Field(
+        default=None, ge=1,
+        description="Ancho del bloque en dots para alinear/ajustar (por defecto hasta el borde derecho)"
+    )
+    max_lines: int = Field(default=1, ge=1, le=20, description="Líneas máximas al ajustar el texto")
+    auto_shrink: bool = Field(default=False, description="Reduce la fuente hasta que el texto quepa")
+    min_font_size: int = Field(default=10, ge=10, le=200, description="Tamaño mínimo al reducir")
 
 
 class BarcodeElement(LabelElement):
@@ -123,3 +136,5 @@ class PrintResponse(BaseModel):
     success: bool
     message: str
     zpl_preview: Optional[str] = Field(default=None, description="Vista previa del código ZPL generado")
+    job_id: Optional[str] = Field(default=None, description="Identificador del trabajo en la cola de impresión")
+    warnings: list[str] = Field(default_factory=list, description="Avisos de maquetación, p. ej. textos recortados")
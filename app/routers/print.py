@@ -1,17 +1,119 @@
-from fastapi import APIRouter, HTTPException, Query
-from app.models import LabelRequest, SimpleLabelRequest, PrintResponse
-from app.services import PrinterService, PrinterConnectionError, ZPLGenerator
+import asyncio
+import hashlib
+import json
+import random
+from dataclasses import dataclass
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from app.config import get_settings
+from app.models import LabelRequest, SimpleLabelRequest, PrintResponse, JobPriority
+from app.services import (
+    PrinterService,
+    PrinterConnectionError,
+    TEST_PAGE_ZPL,
+    ZPLGenerator,
+    QueueFullError,
+    DuplicateJobIdError,
+    JobTooLargeError,
+    IdempotencyKeyConflict,
+    get_print_client,
+)
 import logging
 
-# Configurar el logger
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/print", tags=["Printing"])
 
+SSE_KEEPALIVE_INTERVAL = 15  # segundos sin eventos antes de enviar un comentario keepalive
+
+
+def _sample_request_log() -> bool:
+    """Decide si esta petición se registra con detalle (muestreo)"""
+    return (
+        logger.isEnabledFor(logging.INFO)
+        and random.random() < get_settings().request_log_sample_rate
+    )
+
+
+@dataclass
+class JobOptions:
+    """Prioridad, identidad del cliente, id e idempotencia de un trabajo de impresión"""
+    priority: JobPriority
+    client_id: str
+    endpoint: str
+    idempotency_key: Optional[str] = None
+    job_id: Optional[str] = None
+
+
+def job_options(
+    request: Request,
+    priority: JobPriority = Query(JobPriority.NORMAL, description="Prioridad del trabajo (urgent, normal, bulk)"),
+    x_client_id: Optional[str] = Header(default=None, description="Identificador del cliente para el reparto justo"),
+    idempotency_key: Optional[str] = Header(
+        default=None,
+        alias="Idempotency-Key",
+        description="Un reintento con la misma clave devuelve el resultado original sin reimprimir",
+    ),
+    x_job_id: Optional[str] = Header(
+        default=None,
+        max_length=64,
+        pattern=r"^[A-Za-z0-9_.:-]+$",
+        description=(
+            "Id del trabajo elegido por el cliente, para seguirlo en /print/events desde antes "
+            "de enviarlo; 409 si ya hay un trabajo en curso con ese id"
+        ),
+    ),
+) -> JobOptions:
+    client_id = x_client_id or (request.client.host if request.client else "anonymous")
+    return JobOptions(
+        priority=priority,
+        client_id=client_id,
+        endpoint=request.url.path,
+        idempotency_key=idempotency_key,
+        job_id=x_job_id,
+    )
+
+
+async def _print_job(zpl_code: str, options: JobOptions) -> str:
+    """
+    Encola el ZPL (en el worker dueño de la impresora), espera a que la impresora
+    lo consuma y devuelve el id del trabajo. Con Idempotency-Key el dueño lo
+    imprime una sola vez por clave, reciba el reintento el worker que lo reciba.
+    """
+    idempotency_key = fingerprint = None
+    if options.idempotency_key:
+        idempotency_key = f"{options.endpoint}:{options.idempotency_key}"
+        fingerprint = hashlib.sha256(zpl_code.encode("utf-8")).hexdigest()
+    client = await get_print_client()
+    try:
+        return await client.print_job(
+            zpl_code,
+            options.priority,
+            options.client_id,
+            idempotency_key=idempotency_key,
+            fingerprint=fingerprint,
+            job_id=options.job_id,
+        )
+    except IdempotencyKeyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except DuplicateJobIdError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except JobTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except PrinterConnectionError as e:
+        logger.error("Error al enviar la etiqueta: %s", e)
+        raise HTTPException(status_code=503, detail=str(e))
+
 
 @router.post("/label", response_model=PrintResponse)
-async def print_label(request: LabelRequest, preview_only: bool = Query(False)):
+async def print_label(
+    request: LabelRequest,
+    preview_only: bool = Query(False),
+    options: JobOptions = Depends(job_options),
+):
     """
     Imprime una etiqueta personalizada con control total sobre los elementos.
 
@@ -23,33 +125,39 @@ async def print_label(request: LabelRequest, preview_only: bool = Query(False)):
     - **qr_codes**: Lista de códigos QR
     - **lines**: Lista de líneas/rectángulos
     - **preview_only**: Si es True, solo devuelve el ZPL sin imprimir
+    - **priority**: Prioridad en la cola de impresión
+    - **Idempotency-Key** (header): Evita imprimir dos veces al reintentar
+    - **X-Job-Id** (header): Id del trabajo para seguirlo en /print/events
     """
     generator = ZPLGenerator()
     zpl_code = generator.generate_from_request(request)
     if preview_only:
-        logger.info(f"Etiqueta enviada correctamente ({dict(request)})")
+        logger.debug("Vista previa generada (%s)", request)
         return PrintResponse(
             success=True,
             message="Vista previa generada (no se envió a la impresora)",
-            zpl_preview=zpl_code
+            zpl_preview=zpl_code,
+            warnings=generator.warnings,
         )
 
-    printer = PrinterService()
-    try:
-        await printer.send_zpl(zpl_code)
-        logger.info(f"Etiqueta enviada correctamente ({dict(request)})")
-        return PrintResponse(
-            success=True,
-            message=f"Etiqueta enviada correctamente ({request.copies} copia(s))",
-            zpl_preview=zpl_code
-        )
-    except PrinterConnectionError as e:
-        logger.error(f"Error al enviar la etiqueta: {e}")
-        raise HTTPException(status_code=503, detail=str(e))
+    job_id = await _print_job(zpl_code, options)
+    if _sample_request_log():
+        logger.info("Etiqueta enviada correctamente (job %s): %s", job_id, request)
+    return PrintResponse(
+        success=True,
+        message=f"Etiqueta enviada correctamente ({request.copies} copia(s))",
+        zpl_preview=zpl_code,
+        job_id=job_id,
+        warnings=generator.warnings,
+    )
 
 
 @router.post("/simple", response_model=PrintResponse)
-async def print_simple_label(request: SimpleLabelRequest, preview_only: bool = Query(False)):
+async def print_simple_label(
+    request: SimpleLabelRequest,
+    preview_only: bool = Query(False),
+    options: JobOptions = Depends(job_options),
+):
     """
     Imprime una etiqueta usando un formato simplificado.
 
@@ -61,6 +169,9 @@ async def print_simple_label(request: SimpleLabelRequest, preview_only: bool = Q
     - **copies**: Número de copias
     - **label_size**: Tamaño predefinido (small, medium, large, custom)
     - **preview_only**: Si es True, solo devuelve el ZPL sin imprimir
+    - **priority**: Prioridad en la cola de impresión
+    - **Idempotency-Key** (header): Evita imprimir dos veces al reintentar
+    - **X-Job-Id** (header): Id del trabajo para seguirlo en /print/events
     """
     generator = ZPLGenerator()
     zpl_code = generator.generate_simple_label(request)
@@ -69,69 +180,124 @@ async def print_simple_label(request: SimpleLabelRequest, preview_only: bool = Q
         return PrintResponse(
             success=True,
             message="Vista previa generada (no se envió a la impresora)",
-            zpl_preview=zpl_code
+            zpl_preview=zpl_code,
+            warnings=generator.warnings,
         )
 
-    printer = PrinterService()
-    try:
-        await printer.send_zpl(zpl_code)
-        return PrintResponse(
-            success=True,
-            message=f"Etiqueta enviada correctamente ({request.copies} copia(s))",
-            zpl_preview=zpl_code
-        )
-    except PrinterConnectionError as e:
-        raise HTTPException(status_code=503, detail=str(e))
+    job_id = await _print_job(zpl_code, options)
+    return PrintResponse(
+        success=True,
+        message=f"Etiqueta enviada correctamente ({request.copies} copia(s))",
+        zpl_preview=zpl_code,
+        job_id=job_id,
+        warnings=generator.warnings,
+    )
 
 
 @router.post("/raw", response_model=PrintResponse)
-async def print_raw_zpl(zpl_code: str):
+async def print_raw_zpl(zpl_code: str, options: JobOptions = Depends(job_options)):
     """
     Envía código ZPL directamente a la impresora.
 
     Útil para etiquetas pre-diseñadas o código ZPL generado externamente.
+    Acepta el header Idempotency-Key para reintentos seguros y X-Job-Id para
+    seguir el trabajo en /print/events.
     """
     if not zpl_code.strip():
         raise HTTPException(status_code=400, detail="El código ZPL no puede estar vacío")
 
-    printer = PrinterService()
-    try:
-        await printer.send_zpl(zpl_code)
-        return PrintResponse(
-            success=True,
-            message="Código ZPL enviado correctamente"
-        )
-    except PrinterConnectionError as e:
-        raise HTTPException(status_code=503, detail=str(e))
+    job_id = await _print_job(zpl_code, options)
+    return PrintResponse(
+        success=True,
+        message="Código ZPL enviado correctamente",
+        job_id=job_id,
+    )
 
 
 @router.get("/test", response_model=PrintResponse)
-async def print_test_page():
+async def print_test_page(options: JobOptions = Depends(job_options)):
     """
     Imprime una página de prueba para verificar la conexión con la impresora.
+
+    Pasa por la cola como cualquier otro trabajo.
     """
-    printer = PrinterService()
-    try:
-        await printer.print_test_page()
-        return PrintResponse(
-            success=True,
-            message="Página de prueba enviada correctamente"
-        )
-    except PrinterConnectionError as e:
-        raise HTTPException(status_code=503, detail=str(e))
+    job_id = await _print_job(TEST_PAGE_ZPL, options)
+    return PrintResponse(
+        success=True,
+        message="Página de prueba enviada correctamente",
+        job_id=job_id,
+    )
 
 
 @router.get("/status")
 async def check_printer_status():
     """
     Verifica el estado de conexión con la impresora.
+
+    - **status**: online, busy (otro envío ocupa la conexión; la impresora responde)
+      u offline
+    - **printer_state**: último estado conocido por la cola (~HS), o null si aún no
+      se ha consultado
     """
     printer = PrinterService()
-    is_connected = await printer.test_connection_async()
+    status = await printer.connection_status_async()
+    queue_status = await (await get_print_client()).status()
 
     return {
         "printer_host": printer.host,
         "printer_port": printer.port,
-        "connected": is_connected,
-        "status": "online" if is_connected else "offline"
+        "connected": status != "offline",
+        "status": status,
+        "queued_jobs": queue_status["queued_jobs"],
+        "printer_state": queue_status["printer_state"],
     }
+
+
+@router.get("/events")
+async def stream_events(
+    request: Request,
+    job_id: Optional[str] = Query(None, description="Solo eventos de este trabajo"),
+    client_id: Optional[str] = Query(None, description="Solo eventos de este cliente"),
+):
+    """
+    Flujo Server-Sent Events con el progreso de los trabajos y el estado de la impresora.
+
+    Eventos de trabajo: queued, sent, flushed, consumed, failed.
+    Eventos de impresora: printer_state (online, paper_out, paused, head_up, ...).
+    Los filtros job_id/client_id no afectan a printer_state.
+
+    Las peticiones de impresión esperan a que el trabajo termine, así que para seguir
+    un trabajo en vivo el cliente elige su id: se suscribe con `?job_id=<id>` y luego
+    envía la petición con el header `X-Job-Id: <id>` (por ejemplo un UUID). Con
+    Idempotency-Key, un reintento devuelve el id del trabajo original.
+    """
+    client = await get_print_client()
+
+    def wanted(event: dict) -> bool:
+        if event["type"] == "printer_state":
+            return True
+        if job_id and event.get("job_id") != job_id:
+            return False
+        if client_id and event.get("client_id") != client_id:
+            return False
+        return True
+
+    async def event_stream():
+        async with client.subscribe() as queue:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    # El worker dueño de la impresora terminó; el cliente reconecta
+                    break
+                if wanted(event):
+                    yield f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,4 +1,50 @@
-from app.services.printer import PrinterService, PrinterConnectionError
+from app.services.printer import (
+    PrinterService,
+    PrinterConnectionError,
+    PrinterStatusUnsupported,
+    PrinterStatusNoReply,
+    HostStatus,
+    TEST_PAGE_ZPL,
+)
 from app.services.zpl_generator import ZPLGenerator
+from app.services.text_layout import MeasuredText, TextLayout, fit_text, measure_many, measure_texts
+from app.services.events import EventBus, get_event_bus
+from app.services.idempotency import IdempotencyCache, IdempotencyKeyConflict, get_idempotency_cache
+from app.services.print_queue import DuplicateJobIdError, PrintDispatcher, PrintJob, QueueFullError, get_dispatcher
+from app.services.printer_owner import (
+    JobTooLargeError,
+    LocalPrintClient,
+    PrinterOwnership,
+    RemotePrintClient,
+    get_print_client,
+)
 
-__all__ = ["PrinterService", "PrinterConnectionError", "ZPLGenerator"]
+__all__ = [
+    "PrinterService",
+    "PrinterConnectionError",
+    "PrinterStatusUnsupported",
+    "PrinterStatusNoReply",
+    "HostStatus",
+    "TEST_PAGE_ZPL",
+    "ZPLGenerator",
+    "TextLayout",
+    "fit_text",
+    "measure_many",
+    "MeasuredText",
+    "measure_texts",
+    "PrintDispatcher",
+    "PrintJob",
+    "QueueFullError",
+    "DuplicateJobIdError",
+    "get_dispatcher",
+    "JobTooLargeError",
+    "LocalPrintClient",
+    "RemotePrintClient",
+    "PrinterOwnership",
+    "get_print_client",
+    "IdempotencyCache",
+    "IdempotencyKeyConflict",
+    "get_idempotency_cache",
+    "EventBus",
+    "get_event_bus",
+]
@@ -0,0 +1,52 @@
+import asyncio
+import itertools
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+
+class EventBus:
+    """
+    Difusión en memoria de eventos de trabajos y de la impresora.
+
+    Cada suscriptor recibe su propia cola acotada; si un cliente lento la llena,
+    se descartan sus eventos más antiguos en lugar de frenar a la impresora.
+    """
+
+    def __init__(self, max_queue: int = 1000):
+        self.max_queue = max_queue
+        self._subscribers: set[asyncio.Queue] = set()
+        self._ids = itertools.count(1)
+
+    def has_subscribers(self) -> bool:
+        return bool(self._subscribers)
+
+    def publish(self, event_type: str, **data: Any) -> dict:
+        """Envía un evento a todos los suscriptores"""
+        event = {"id": next(self._ids), "type": event_type, "timestamp": time.time(), **data}
+        for queue in self._subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+        return event
+
+    @contextmanager
+    def subscribe(self) -> Iterator[asyncio.Queue]:
+        """Cola con los eventos publicados mientras dure el contexto"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_queue)
+        self._subscribers.add(queue)
+        try:
+            yield queue
+        finally:
+            self._subscribers.discard(queue)
+
+
+_bus: Optional[EventBus] = None
+
+
+def get_event_bus() -> EventBus:
+    """Bus de eventos del worker"""
+    global _bus
+    if _bus is None:
+        _bus = EventBus()
+    return _bus
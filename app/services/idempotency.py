@@ -0,0 +1,221 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Iterator, Optional
+
+from app.config import get_settings
+from app.services.printer_lock import fcntl
+
+logger = logging.getLogger(__name__)
+
+
+class IdempotencyKeyConflict(Exception):
+    """La clave ya se usó con una petición distinta"""
+    pass
+
+
+class IdempotencyCache:
+    """
+    Caché acotada (LRU + TTL) de resultados por Idempotency-Key.
+
+    Un reintento con la misma clave devuelve el resultado original sin volver a
+    imprimir; si el original sigue en curso, el reintento espera a ese mismo trabajo.
+    Solo se guardan resultados exitosos, así que un reintento tras un error sí vuelve
+    a intentar la impresión.
+
+    Con `persist_path` las entradas se añaden a un archivo JSON Lines que se
+    relee (y compacta) al arrancar, para que la deduplicación sobreviva a un
+    reinicio. Con varios workers la caché vive en el dueño de la impresora (ver
+    PrinterOwnership), que es quien escribe el archivo; aun así, añadir y compactar
+    se hacen bajo un flock y la compactación fusiona lo que haya en el archivo, para
+    no perder entradas de un dueño anterior.
+
+    Las escrituras van a un hilo propio para no bloquear el event loop; la carga
+    inicial es síncrona, así que la caché debe crearse fuera del loop (ver
+    get_idempotency_cache).
+    """
+
+    def __init__(self, max_entries: int, ttl: float, persist_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.persist_path = persist_path
+        # clave -> (expira_en, huella, resultado), de la menos a la más reciente
+        self._entries: OrderedDict[str, tuple[float, str, Any]] = OrderedDict()
+        self._in_flight: dict[str, tuple[str, asyncio.Task]] = {}
+        self._log_lines = 0
+        # Un solo hilo escritor: las líneas llegan al archivo en orden
+        self._writer: Optional[ThreadPoolExecutor] = None
+        if persist_path:
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="idempotency")
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str, fingerprint: str) -> Optional[Any]:
+        """Resultado guardado para la clave, o None si no existe o expiró"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, stored_fingerprint, result = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            return None
+        if stored_fingerprint != fingerprint:
+            raise IdempotencyKeyConflict(
+                f"La clave de idempotencia '{key}' ya se usó con otra petición"
+            )
+        self._entries.move_to_end(key)
+        return result
+
+    async def run(self, key: str, fingerprint: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Ejecuta `func` una sola vez por clave y devuelve su resultado.
+
+        Raises:
+            IdempotencyKeyConflict: Si la clave ya se usó con otra huella
+        """
+        cached = self.get(key, fingerprint)
+        if cached is not None:
+            return cached
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            running_fingerprint, task = in_flight
+            if running_fingerprint != fingerprint:
+                raise IdempotencyKeyConflict(
+                    f"La clave de idempotencia '{key}' ya se usó con otra petición"
+                )
+        else:
+            task = asyncio.get_running_loop().create_task(func())
+            self._in_flight[key] = (fingerprint, task)
+            task.add_done_callback(lambda t: self._finish(key, fingerprint, t))
+        # shield: si el cliente se desconecta, la impresión termina y queda registrada
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, fingerprint: str, task: asyncio.Task) -> None:
+        self._in_flight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        self._store(key, fingerprint, task.result(), time.time() + self.ttl)
+
+    def _store(self, key: str, fingerprint: str, result: Any, expires_at: float) -> None:
+        self._entries[key] = (expires_at, fingerprint, result)
+        self._entries.move_to_end(key)
+        self._evict()
+        if self._writer is not None:
+            line = json.dumps({"key": key, "fingerprint": fingerprint, "expires_at": expires_at, "result": result})
+            # El flock y la escritura no bloquean el event loop
+            self._writer.submit(self._append, line)
+
+    def _evict(self) -> None:
+        now = time.time()
+        # Las entradas más antiguas expiran primero (TTL fijo)
+        while self._entries:
+            oldest_key, (expires_at, _, _) = next(iter(self._entries.items()))
+            if len(self._entries) <= self.max_entries and expires_at > now:
+                break
+            del self._entries[oldest_key]
+
+    def flush(self) -> None:
+        """Espera a que terminen las escrituras pendientes en el archivo"""
+        if self._writer is not None:
+            self._writer.submit(lambda: None).result()
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        """flock sobre un archivo hermano estable (el archivo de datos se reemplaza al compactar)"""
+        if fcntl is None:
+            yield
+            return
+        fd = os.open(f"{self.persist_path}.lock", os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def _append(self, line: str) -> None:
+        """Añade una entrada al archivo (en el hilo escritor)"""
+        try:
+            with self._file_lock():
+                with open(self.persist_path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+                self._log_lines += 1
+                if self._log_lines > 2 * self.max_entries:
+                    self._compact_locked()
+        except OSError as e:
+            logger.warning("No se pudo persistir la caché de idempotencia: %s", e)
+
+    def _read_file(self) -> OrderedDict[str, tuple[float, str, Any]]:
+        """Entradas vigentes del archivo, de la menos a la más reciente"""
+        entries: OrderedDict[str, tuple[float, str, Any]] = OrderedDict()
+        now = time.time()
+        try:
+            with open(self.persist_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        item = json.loads(line)
+                        # La última línea de una clave es la vigente
+                        entries.pop(item["key"], None)
+                        if item["expires_at"] > now:
+                            entries[item["key"]] = (item["expires_at"], item["fingerprint"], item["result"])
+                    except (ValueError, KeyError):
+                        continue
+        except FileNotFoundError:
+            pass
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+        return entries
+
+    def _load(self) -> None:
+        try:
+            with self._file_lock():
+                self._entries = self._compact_locked()
+        except OSError as e:
+            logger.warning("No se pudo leer la caché de idempotencia: %s", e)
+
+    def _compact_locked(self) -> OrderedDict[str, tuple[float, str, Any]]:
+        """
+        Reescribe el archivo solo con las entradas vigentes (con el flock tomado).
+
+        Trabaja solo sobre el archivo, no sobre la memoria del event loop: incluye
+        lo que escribió un dueño anterior.
+        """
+        entries = self._read_file()
+        tmp_path = f"{self.persist_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for key, (expires_at, fingerprint, result) in entries.items():
+                    f.write(json.dumps({"key": key, "fingerprint": fingerprint, "expires_at": expires_at, "result": result}) + "\n")
+            os.replace(tmp_path, self.persist_path)
+            self._log_lines = len(entries)
+        except OSError as e:
+            logger.warning("No se pudo compactar la caché de idempotencia: %s", e)
+        return entries
+
+
+_cache: Optional[IdempotencyCache] = None
+
+
+def get_idempotency_cache() -> IdempotencyCache:
+    """
+    Caché de idempotencia del worker dueño de la impresora.
+
+    La primera llamada lee el archivo de persistencia: desde async, llamar con
+    asyncio.to_thread.
+    """
+    global _cache
+    if _cache is None:
+        settings = get_settings()
+        _cache = IdempotencyCache(
+            max_entries=settings.idempotency_max_entries,
+            ttl=settings.idempotency_ttl,
+            persist_path=settings.idempotency_persist_path,
+        )
+    return _cache
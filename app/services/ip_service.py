@@ -1,21 +1,24 @@
 import socket
-import psycopg
 import logging
 import os
+from typing import Optional
 
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
 logger = logging.getLogger(__name__)
 
 
 class IpService:
     def __init__(self, database_url: str | None = None):
-        self.ip_local = self.obtener_ip_local()
         self.database_url = database_url
-        
+        self._ip_local: Optional[str] = None
+
+    @property
+    def ip_local(self) -> str:
+        """IP local, detectada la primera vez que se necesita"""
+        if self._ip_local is None:
+            self._ip_local = self.obtener_ip_local()
+        return self._ip_local
+
     def obtener_ip_local(self):
         try:
             ip_local = os.getenv("HOST_LAN_IP")
@@ -38,19 +41,22 @@ class IpService:
         """
         if not self.database_url:
             return False
+        # Import diferido: psycopg solo hace falta si hay BD configurada
+        import psycopg
+
         with psycopg.connect(self.database_url) as conn:
-            logger.info(f"Ejecutando consulta en la BD")
+            logger.info("Ejecutando consulta en la BD")
             with conn.cursor() as cur:
                 cur.execute(
                     "UPDATE public.configuracion_printers SET ip = %s WHERE id = %s",
                     (self.ip_local, 1),
                 )
                 conn.commit()
-                logger.info(f"Columnas afectadas: {cur.rowcount}")
+                logger.info("Columnas afectadas: %s", cur.rowcount)
                 if cur.rowcount > 0:
-                    logger.info(f"IP local actualizada en la BD")
+                    logger.info("IP local actualizada en la BD")
                 else:
-                    logger.error(f"IP local no actualizada en la BD")
+                    logger.error("IP local no actualizada en la BD")
                     return False
                 
         return True
@@ -0,0 +1,453 @@
+import asyncio
+import logging
+import re
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Optional
+
+from app.config import get_settings
+from app.models.label import JobPriority
+from app.services.events import EventBus, get_event_bus
+from app.services.printer import (
+    HostStatus,
+    PrinterConnectionError,
+    PrinterService,
+    PrinterStatusNoReply,
+    PrinterStatusUnsupported,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """El cliente alcanzó su límite de trabajos pendientes"""
+    pass
+
+
+class DuplicateJobIdError(Exception):
+    """El id elegido por el cliente ya pertenece a un trabajo en cola o en curso"""
+    pass
+
+
+_END_OF_FORMAT = re.compile(r"(?<=\^XZ)", re.IGNORECASE)
+
+
+def split_documents(zpl_code: str) -> list[str]:
+    """Parte el ZPL en formatos (uno por ^XZ); /raw puede traer varios en un trabajo"""
+    documents = [part for part in _END_OF_FORMAT.split(zpl_code) if part.strip()]
+    return documents or [zpl_code]
+
+
+@dataclass
+class PrintJob:
+    """Trabajo ZPL pendiente; se envía formato a formato"""
+    zpl_code: str
+    priority: JobPriority
+    client_id: str
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    future: asyncio.Future = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+    documents: list[str] = field(init=False)
+    documents_sent: int = 0
+    documents_consumed: int = 0
+
+    def __post_init__(self) -> None:
+        self.documents = split_documents(self.zpl_code)
+
+    @property
+    def confirmed(self) -> str:
+        """Resumen para reimprimir con exactitud tras un fallo"""
+        return f"documentos confirmados: {self.documents_consumed} de {len(self.documents)}"
+
+    async def wait(self) -> bool:
+        """Espera a que el trabajo se complete (o propaga su error)"""
+        return await asyncio.shield(self.future)
+
+
+class PrintDispatcher:
+    """
+    Cola de impresión con prioridades y reparto justo entre clientes.
+
+    Los trabajos se envían formato a formato (cada ^XZ), y la prioridad se aplica en
+    esos límites de documento: un trabajo URGENT pasa delante de todo lo pendiente,
+    incluido el resto de un trabajo a medio enviar, pero no interrumpe el documento
+    que ya se está enviando. Dentro de cada prioridad los clientes se atienden por
+    turnos (round-robin) documento a documento, de modo que un lote de miles de
+    etiquetas de un cliente no acapara la impresora.
+
+    Control de flujo: como máximo `max_in_flight` documentos enviados y aún no
+    consumidos por la impresora. Tras cada envío se consulta ~HS y un trabajo solo se
+    da por completo cuando la impresora lo ha sacado del buffer y terminado de imprimir;
+    si deja de haber progreso durante `stall_timeout`, los trabajos sin confirmar fallan
+    y pueden reimprimirse con exactitud. Antes del primer envío se comprueba que la
+    impresora responde a ~HS. Si responde con algo que no es un estado
+    `max_status_failures` veces seguidas, no soporta ~HS: el control de flujo se
+    desactiva y los trabajos se dan por completos al enviarse. Si simplemente no
+    responde (puede estar ocupada), el control se suspende solo durante
+    `reprobe_interval` y luego se vuelve a probar.
+    Una vez confirmado ~HS, un timeout puntual es transitorio (lo cubre `stall_timeout`)
+    y solo varias respuestas inválidas seguidas desactivan el control; en ese caso los
+    trabajos sin confirmar fallan, nunca se dan por impresos.
+
+    Eventos: publica en el EventBus el ciclo de vida de cada trabajo (queued, sent,
+    flushed, consumed, failed) y los cambios de estado de la impresora (printer_state).
+    Mientras haya suscriptores, el estado se consulta también con la cola vacía.
+
+    El conteo de consumidos compara los documentos en vuelo con los formatos que ~HS
+    reporta en el buffer, así que solo es correcto si este dispatcher es el único que
+    escribe en la impresora. Con varios workers solo el dueño (ver PrinterOwnership)
+    lo ejecuta: la cola, el límite de documentos en vuelo y el conteo son únicos por
+    impresora. Donde no puede haber dueño único, el control de flujo se desactiva.
+    """
+
+    PRIORITY_ORDER = (JobPriority.URGENT, JobPriority.NORMAL, JobPriority.BULK)
+
+    def __init__(
+        self,
+        printer: Optional[PrinterService] = None,
+        max_per_client: Optional[int] = None,
+        max_in_flight: Optional[int] = None,
+        events: Optional[EventBus] = None,
+    ):
+        settings = get_settings()
+        self.printer = printer or PrinterService()
+        self.events = events or get_event_bus()
+        self.state_poll_interval = settings.printer_state_poll_interval
+        self.max_status_failures = settings.printer_status_max_failures
+        self.reprobe_interval = settings.printer_status_reprobe_interval
+        # Momento en que se vuelve a probar ~HS tras suspender el control por falta de respuesta
+        self._reprobe_at: Optional[float] = None
+        # None: aún no se sabe si la impresora responde a ~HS
+        self._status_supported: Optional[bool] = None
+        self._status_failures = 0
+        self._printer_state: Optional[dict] = None
+        self.max_per_client = max_per_client or settings.queue_max_per_client
+        self.max_in_flight = settings.printer_max_in_flight if max_in_flight is None else max_in_flight
+        self._configured_max_in_flight = self.max_in_flight
+        self.poll_interval = settings.printer_status_poll_interval
+        self.stall_timeout = settings.printer_stall_timeout
+        # Un elemento por documento enviado y aún no consumido, en orden de envío
+        self._in_flight: deque[PrintJob] = deque()
+        self._last_progress = 0.0
+        self._last_labels_remaining: Optional[int] = None
+        # prioridad -> cliente -> trabajos en orden de llegada
+        self._queues: dict[JobPriority, OrderedDict[str, deque[PrintJob]]] = {
+            priority: OrderedDict() for priority in self.PRIORITY_ORDER
+        }
+        self._pending_per_client: dict[str, int] = {}
+        # Ids de los trabajos aún no terminados (en cola, enviándose o en vuelo)
+        self._active_ids: set[str] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    @property
+    def printer_state(self) -> Optional[dict]:
+        """Último estado publicado de la impresora (None si aún no se consultó)"""
+        return self._printer_state
+
+    def pending(self, client_id: Optional[str] = None) -> int:
+        """Número de trabajos en cola, total o de un cliente"""
+        if client_id is not None:
+            return self._pending_per_client.get(client_id, 0)
+        return sum(self._pending_per_client.values())
+
+    def submit(
+        self,
+        zpl_code: str,
+        priority: JobPriority = JobPriority.NORMAL,
+        client_id: str = "anonymous",
+        job_id: Optional[str] = None,
+    ) -> PrintJob:
+        """
+        Encola un documento ZPL.
+
+        `job_id` permite al cliente elegir el id del trabajo (por ejemplo para
+        suscribirse a /print/events antes de enviarlo); si no se da, se genera uno.
+
+        Raises:
+            QueueFullError: Si el cliente ya tiene `max_per_client` trabajos pendientes
+            DuplicateJobIdError: Si `job_id` ya pertenece a un trabajo sin terminar
+        """
+        if job_id and job_id in self._active_ids:
+            raise DuplicateJobIdError(f"Ya hay un trabajo en curso con id '{job_id}'")
+        if self.pending(client_id) >= self.max_per_client:
+            raise QueueFullError(
+                f"El cliente '{client_id}' tiene {self.max_per_client} trabajos pendientes"
+            )
+        job = PrintJob(zpl_code=zpl_code, priority=priority, client_id=client_id)
+        if job_id:
+            job.id = job_id
+        self._active_ids.add(job.id)
+        job.future.add_done_callback(lambda _: self._active_ids.discard(job.id))
+        self._queues[priority].setdefault(client_id, deque()).append(job)
+        self._pending_per_client[client_id] = self.pending(client_id) + 1
+        self.events.publish(
+            "queued",
+            job_id=job.id,
+            client_id=client_id,
+            priority=priority.value,
+            queued_jobs=self.pending(),
+        )
+        self.start()
+        return job
+
+    def start(self) -> None:
+        """Arranca el worker si no está corriendo y lo despierta"""
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+        self._wakeup.set()
+
+    def _next_job(self) -> Optional[PrintJob]:
+        """Siguiente trabajo: prioridad estricta, round-robin entre clientes"""
+        for priority in self.PRIORITY_ORDER:
+            clients = self._queues[priority]
+            while clients:
+                client_id, jobs = clients.popitem(last=False)
+                job = jobs.popleft()
+                if jobs:
+                    # El cliente pasa al final del turno
+                    clients[client_id] = jobs
+                remaining = self._pending_per_client[client_id] - 1
+                if remaining:
+                    self._pending_per_client[client_id] = remaining
+                else:
+                    del self._pending_per_client[client_id]
+                if not job.future.done():
+                    # Un trabajo a medio enviar que ya falló no se sigue enviando
+                    return job
+        return None
+
+    def _requeue(self, job: PrintJob) -> None:
+        """Devuelve un trabajo a medio enviar al frente de la cola de su cliente"""
+        self._queues[job.priority].setdefault(job.client_id, deque()).appendleft(job)
+        self._pending_per_client[job.client_id] = self.pending(job.client_id) + 1
+
+    def _documents_in_flight(self) -> int:
+        return len(self._in_flight)
+
+    def _has_queued(self) -> bool:
+        return any(self._queues[priority] for priority in self.PRIORITY_ORDER)
+
+    def _job_event(self, event_type: str, job: PrintJob, **data) -> None:
+        self.events.publish(event_type, job_id=job.id, client_id=job.client_id, **data)
+
+    def _complete(self, job: PrintJob) -> None:
+        if job.future.done():
+            return
+        self._job_event("consumed", job)
+        job.future.set_result(True)
+
+    def _fail(self, job: PrintJob, error: Exception) -> None:
+        if job.future.done():
+            return
+        logger.error("Trabajo %s (%s) falló: %s", job.id, job.client_id, error)
+        self._job_event(
+            "failed",
+            job,
+            error=str(error),
+            documents_consumed=job.documents_consumed,
+            documents=len(job.documents),
+        )
+        job.future.set_exception(error)
+
+    def _publish_state(self, status: Optional[HostStatus]) -> None:
+        """Publica printer_state si cambió respecto a la última consulta"""
+        if status is None:
+            state = {"online": False}
+        else:
+            state = {
+                "online": True,
+                "paper_out": status.paper_out,
+                "paused": status.paused,
+                "head_up": status.head_up,
+                "ribbon_out": status.ribbon_out,
+                "buffer_full": status.buffer_full,
+            }
+        if state != self._printer_state:
+            self._printer_state = state
+            self.events.publish("printer_state", **state)
+
+    def _fail_in_flight(self, reason: str) -> None:
+        """Falla los trabajos enviados que la impresora no llegó a confirmar"""
+        # Un trabajo puede tener varios documentos en vuelo
+        jobs = list({job.id: job for job in self._in_flight}.values())
+        self._in_flight.clear()
+        for job in jobs:
+            self._fail(job, PrinterConnectionError(f"{reason} ({job.confirmed})"))
+
+    def _document_consumed(self, job: PrintJob) -> None:
+        job.documents_consumed += 1
+        if job.documents_consumed == len(job.documents):
+            self._complete(job)
+
+    def _status_failure(self, error: Exception, permanent: bool = True) -> None:
+        """
+        Cuenta una respuesta ~HS inútil; tras varias seguidas, desactiva el control de
+        flujo: para siempre si la respuesta no es un estado (`permanent`), o hasta
+        `reprobe_interval` si la impresora no respondió
+        """
+        self._status_failures += 1
+        if self._status_failures < self.max_status_failures:
+            logger.warning(
+                "Respuesta ~HS no válida (%d/%d): %s",
+                self._status_failures, self.max_status_failures, error,
+            )
+            return
+        if permanent:
+            logger.warning("Control de flujo desactivado, la impresora no soporta ~HS: %s", error)
+            self._status_supported = False
+        else:
+            logger.warning(
+                "Control de flujo suspendido %ss, la impresora no responde a ~HS: %s",
+                self.reprobe_interval, error,
+            )
+            self._status_failures = 0
+            self._reprobe_at = time.monotonic() + self.reprobe_interval
+        self.max_in_flight = 0
+        self._fail_in_flight(
+            "La impresora dejó de confirmar trabajos (~HS no disponible); puede no haberse impreso"
+        )
+
+    async def _query_status(self) -> Optional[HostStatus]:
+        """Consulta ~HS; None si no hay un estado utilizable"""
+        try:
+            status = await self.printer.query_host_status()
+        except PrinterStatusUnsupported as e:
+            self._status_failure(e)
+            return None
+        except PrinterStatusNoReply as e:
+            if self._status_supported is None:
+                if self._reprobe_at is None:
+                    self._status_failure(e, permanent=False)
+            else:
+                # Ya respondió antes: es transitorio y lo cubre stall_timeout
+                logger.warning("No se pudo consultar el estado de la impresora: %s", e)
+            return None
+        except PrinterConnectionError as e:
+            logger.warning("No se pudo consultar el estado de la impresora: %s", e)
+            self._publish_state(None)
+            return None
+        self._status_supported = True
+        self._status_failures = 0
+        if self._reprobe_at is not None:
+            # Volvió a responder durante la suspensión
+            self._reprobe_at = None
+            self.max_in_flight = self._configured_max_in_flight
+        self._publish_state(status)
+        return status
+
+    async def _probe_status(self) -> None:
+        """Comprueba que la impresora responde a ~HS antes de depender de ello"""
+        while self._status_supported is None and self.max_in_flight > 0:
+            failures = self._status_failures
+            status = await self._query_status()
+            if status is None and self._status_failures == failures:
+                # Error de conexión: el envío dirá si la impresora está caída
+                return
+
+    def _apply_status(self, status: HostStatus) -> None:
+        """Marca como completos los documentos que la impresora ya consumió"""
+        consumed = max(0, self._documents_in_flight() - status.documents_pending)
+        progressed = consumed > 0 or (
+            self._last_labels_remaining is not None
+            and status.labels_remaining < self._last_labels_remaining
+        )
+        self._last_labels_remaining = status.labels_remaining
+        if progressed or status.halted:
+            # Sin papel o en pausa no es un fallo: los documentos siguen en el buffer
+            self._last_progress = time.monotonic()
+        for _ in range(min(consumed, len(self._in_flight))):
+            self._document_consumed(self._in_flight.popleft())
+
+    async def _poll_in_flight(self) -> None:
+        """Consulta ~HS una vez y actualiza los trabajos en vuelo"""
+        status = await self._query_status()
+        if status is not None:
+            self._apply_status(status)
+
+        if self._in_flight and time.monotonic() - self._last_progress > self.stall_timeout:
+            self._fail_in_flight(
+                f"La impresora no confirmó el trabajo en {self.stall_timeout}s; "
+                "puede no haberse impreso"
+            )
+            return
+        if self._in_flight:
+            await asyncio.sleep(self.poll_interval)
+
+    async def _idle(self) -> None:
+        """Espera nuevos trabajos; con suscriptores, vigila el estado de la impresora"""
+        self._wakeup.clear()
+        if not (self.events.has_subscribers() and self._status_supported is not False):
+            await self._wakeup.wait()
+            return
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=self.state_poll_interval)
+        except asyncio.TimeoutError:
+            await self._query_status()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._step()
+            except Exception:
+                # Un error inesperado no debe dejar colgados los trabajos pendientes
+                logger.exception("Error en el dispatcher de impresión")
+                await asyncio.sleep(self.poll_interval)
+
+    async def _step(self) -> None:
+        """Un paso del dispatcher: consultar los documentos en vuelo o enviar el siguiente"""
+        if self._in_flight and (
+            self._documents_in_flight() >= self.max_in_flight or not self._has_queued()
+        ):
+            await self._poll_in_flight()
+            return
+        job = self._next_job()
+        if job is None:
+            await self._idle()
+            return
+        if self._reprobe_at is not None and time.monotonic() >= self._reprobe_at:
+            # Fin de la suspensión: se vuelve a probar ~HS antes de este envío
+            self._reprobe_at = None
+            self.max_in_flight = self._configured_max_in_flight
+        if self.max_in_flight > 0 and self._status_supported is None and not self._in_flight:
+            await self._probe_status()
+        index = job.documents_sent
+        document = job.documents[index]
+        if index == 0:
+            self._job_event("sent", job, priority=job.priority.value, documents=len(job.documents))
+        try:
+            await self.printer.send_zpl(document)
+        except Exception as e:
+            self._fail(job, PrinterConnectionError(f"{e} ({job.confirmed})"))
+            return
+        job.documents_sent += 1
+        self._job_event(
+            "flushed",
+            job,
+            document=job.documents_sent,
+            documents=len(job.documents),
+            bytes=len(document.encode("utf-8")),
+        )
+        if job.documents_sent < len(job.documents):
+            # El resto del trabajo vuelve a competir en el siguiente límite de documento
+            self._requeue(job)
+        if self.max_in_flight <= 0:
+            self._document_consumed(job)
+            return
+        if not self._in_flight:
+            self._last_progress = time.monotonic()
+            self._last_labels_remaining = None
+        self._in_flight.append(job)
+
+
+_dispatcher: Optional[PrintDispatcher] = None
+
+
+def get_dispatcher() -> PrintDispatcher:
+    """Dispatcher de la impresora configurada (solo lo usa el worker dueño)"""
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = PrintDispatcher()
+    return _dispatcher
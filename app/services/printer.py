@@ -1,7 +1,32 @@
 import socket
 import asyncio
+from dataclasses import dataclass
 from typing import Optional
 from app.config import get_settings
+from app.services.printer_lock import PrinterLease, PrinterLeaseTimeout
+
+
+# Página de prueba (/print/test)
+TEST_PAGE_ZPL = """
+^XA
+^PW480
+^LL320
+^LH0,0
+^FO50,30
+^A0N,40,40
+^FDTest de Impresion^FS
+^FO50,90
+^A0N,25,25
+^FDRibetec RT-420ME^FS
+^FO50,130
+^A0N,25,25
+^FDConexion exitosa!^FS
+^FO50,180
+^BQN,2,5
+^FDQA,API-RIBETEC-PRINTER^FS
+^PQ1
+^XZ
+"""
 
 
 class PrinterConnectionError(Exception):
@@ -9,14 +34,87 @@ class PrinterConnectionError(Exception):
     pass
 
 
+class PrinterStatusUnsupported(Exception):
+    """La impresora respondió a ~HS con algo que no es un estado válido"""
+    pass
+
+
+class PrinterStatusNoReply(PrinterConnectionError):
+    """La impresora no respondió a ~HS a tiempo (puede ser transitorio)"""
+    pass
+
+
+@dataclass
+class HostStatus:
+    """Estado devuelto por ~HS (Host Status Return)"""
+    paper_out: bool
+    paused: bool
+    formats_in_buffer: int
+    buffer_full: bool
+    head_up: bool
+    ribbon_out: bool
+    labels_remaining: int
+
+    @property
+    def documents_pending(self) -> int:
+        """Formatos aún no consumidos: los del buffer más el que se está imprimiendo"""
+        return self.formats_in_buffer + (1 if self.labels_remaining > 0 else 0)
+
+    @property
+    def halted(self) -> bool:
+        """La impresora está detenida por una condición conocida (papel, pausa, cabezal)"""
+        return self.paper_out or self.paused or self.head_up or self.ribbon_out
+
+    @classmethod
+    def parse(cls, raw: bytes) -> "HostStatus":
+        """
+        Interpreta la respuesta de ~HS: tres cadenas delimitadas por STX/ETX.
+
+        Cadena 1: aaa,b,c,dddd,eee,f,... (b=sin papel, c=pausa, eee=formatos en buffer, f=buffer lleno)
+        Cadena 2: mmm,n,o,p,q,r,s,t,uuuuuuuu,... (o=cabezal abierto, p=sin ribbon, uuuuuuuu=etiquetas restantes)
+        """
+        text = raw.decode("ascii", errors="ignore")
+        lines = [part.strip() for part in text.replace("\x02", "\x03").split("\x03") if part.strip()]
+        if len(lines) < 2:
+            raise PrinterStatusUnsupported(f"Respuesta ~HS incompleta: {raw!r}")
+        first = lines[0].split(",")
+        second = lines[1].split(",")
+        try:
+            return cls(
+                paper_out=first[1] == "1",
+                paused=first[2] == "1",
+                formats_in_buffer=int(first[4]),
+                buffer_full=first[5] == "1",
+                head_up=second[2] == "1",
+                ribbon_out=second[3] == "1",
+                labels_remaining=int(second[8]),
+            )
+        except (IndexError, ValueError):
+            raise PrinterStatusUnsupported(f"Respuesta ~HS no reconocida: {raw!r}")
+
+
 class PrinterService:
     """Servicio para comunicación con impresora térmica via socket TCP"""
 
+    STATUS_LEASE_TIMEOUT = 1.0  # segundos; si el lease sigue ocupado, la impresora está "busy"
+
     def __init__(self, host: Optional[str] = None, port: Optional[int] = None):
         settings = get_settings()
         self.host = host or settings.host_ribetec_printer
         self.port = port or settings.printer_port
         self.timeout = 10  # segundos
+        self.status_timeout = settings.printer_status_timeout
+        self.lock_dir = settings.printer_lock_dir
+        self.lock_timeout = settings.printer_lock_timeout
+
+    def _lease(self, timeout: Optional[float] = None) -> PrinterLease:
+        """Lease exclusivo sobre la impresora, compartido entre workers"""
+        return PrinterLease(
+            self.host,
+            self.port,
+            self.lock_dir,
+            self.lock_timeout if timeout is None else timeout,
+        )
 
     async def send_zpl(self, zpl_code: str) -> bool:
         """
@@ -36,6 +134,8 @@ class PrinterService:
             loop = asyncio.get_event_loop()
             await loop.run_in_executor(None, self._send_sync, zpl_code)
             return True
+        except PrinterLeaseTimeout as e:
+            raise PrinterConnectionError(str(e))
         except socket.timeout:
             raise PrinterConnectionError(
                 f"Timeout al conectar con la impresora en {self.host}:{self.port}"
@@ -51,25 +151,90 @@ class PrinterService:
 
     def _send_sync(self, zpl_code: str) -> None:
         """Envía código ZPL de forma síncrona"""
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        with self._lease(), socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
             sock.settimeout(self.timeout)
             sock.connect((self.host, self.port))
             sock.sendall(zpl_code.encode("utf-8"))
 
-    def test_connection(self) -> bool:
+    def _query_host_status_sync(self) -> HostStatus:
+        """Envía ~HS y lee las tres cadenas de estado"""
+        with self._lease(), socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect((self.host, self.port))
+            sock.sendall(b"~HS")
+            sock.settimeout(self.status_timeout)
+            raw = b""
+            try:
+                while raw.count(b"\x03") < 3:
+                    chunk = sock.recv(1024)
+                    if not chunk:
+                        break
+                    raw += chunk
+            except socket.timeout:
+                # Las dos primeras cadenas bastan; menos es una respuesta lenta, no inválida
+                if raw.count(b"\x03") < 2:
+                    raise PrinterStatusNoReply(
+                        f"La impresora no respondió a ~HS en {self.status_timeout}s"
+                    )
+        if not raw:
+            raise PrinterStatusNoReply("La impresora cerró la conexión sin responder a ~HS")
+        return HostStatus.parse(raw)
+
+    async def query_host_status(self) -> HostStatus:
         """
-        Prueba la conexión con la impresora.
+        Consulta el estado de la impresora (~HS).
 
         Returns:
-            True si la conexión es exitosa
+            HostStatus con formatos en buffer y etiquetas restantes
+
+        Raises:
+            PrinterStatusUnsupported: Si la respuesta a ~HS no es un estado válido
+            PrinterStatusNoReply: Si la impresora no responde a ~HS a tiempo
+            PrinterConnectionError: Si hay error de conexión
         """
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(None, self._query_host_status_sync)
+        except (PrinterStatusUnsupported, PrinterConnectionError):
+            raise
+        except PrinterLeaseTimeout as e:
+            raise PrinterConnectionError(str(e))
+        except (socket.timeout, socket.error) as e:
+            raise PrinterConnectionError(
+                f"Error al consultar el estado de la impresora: {e}"
+            )
+
+    def connection_status(self) -> str:
+        """
+        Estado de la conexión con la impresora.
+
+        Returns:
+            "online" si acepta la conexión, "busy" si otro envío tiene el lease (la
+            impresora está trabajando, no caída) u "offline" si no se pudo conectar
+        """
+        try:
+            with self._lease(timeout=self.STATUS_LEASE_TIMEOUT), socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
                 sock.settimeout(5)
                 sock.connect((self.host, self.port))
-                return True
+                return "online"
+        except PrinterLeaseTimeout:
+            return "busy"
         except Exception:
-            return False
+            return "offline"
+
+    async def connection_status_async(self) -> str:
+        """Estado de la conexión de forma asíncrona"""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.connection_status)
+
+    def test_connection(self) -> bool:
+        """
+        Prueba la conexión con la impresora.
+
+        Returns:
+            True si la impresora está conectada (aunque esté ocupada con otro envío)
+        """
+        return self.connection_status() != "offline"
 
     async def test_connection_async(self) -> bool:
         """Prueba la conexión de forma asíncrona"""
@@ -83,24 +248,4 @@ class PrinterService:
         Returns:
             True si la impresión fue exitosa
         """
-        test_zpl = """
-^XA
-^PW480
-^LL320
-^LH0,0
-^FO50,30
-^A0N,40,40
-^FDTest de Impresion^FS
-^FO50,90
-^A0N,25,25
-^FDRibetec RT-420ME^FS
-^FO50,130
-^A0N,25,25
-^FDConexion exitosa!^FS
-^FO50,180
-^BQN,2,5
-^FDQA,API-RIBETEC-PRINTER^FS
-^PQ1
-^XZ
-"""
-        return await self.send_zpl(test_zpl)
+        return await self.send_zpl(TEST_PAGE_ZPL)
@@ -0,0 +1,138 @@
+import os
+import re
+import threading
+import time
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo coordinación dentro del proceso
+    fcntl = None
+
+
+class PrinterLeaseTimeout(Exception):
+    """No se pudo obtener el lease de la impresora a tiempo"""
+    pass
+
+
+# Un lock por impresora dentro del proceso, para no hacer polling de flock entre hilos
+_thread_locks: dict[str, threading.Lock] = {}
+_thread_locks_guard = threading.Lock()
+
+
+def _thread_lock_for(key: str) -> threading.Lock:
+    with _thread_locks_guard:
+        lock = _thread_locks.get(key)
+        if lock is None:
+            lock = _thread_locks[key] = threading.Lock()
+        return lock
+
+
+def lock_path(lock_dir: str, host: str, port: int, suffix: str) -> str:
+    """Ruta de un archivo de coordinación para la impresora host:port"""
+    safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", f"{host}:{port}")
+    return os.path.join(lock_dir, f"{safe_name}.{suffix}")
+
+
+class PrinterOwnerLock:
+    """
+    Lock de dueño de la impresora, retenido durante toda la vida del worker.
+
+    Solo el worker que lo obtiene ejecuta la cola de impresión; si muere, el
+    sistema libera el flock y otro worker puede tomar el relevo.
+    """
+
+    def __init__(self, host: str, port: int, lock_dir: str):
+        self.lock_dir = lock_dir
+        self.path = lock_path(lock_dir, host, port, "owner")
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        """Intenta obtener el lock sin esperar"""
+        if self._fd is not None:
+            return True
+        if fcntl is None:
+            return False
+        os.makedirs(self.lock_dir, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class PrinterLease:
+    """
+    Lease exclusivo sobre una impresora, compartido entre procesos.
+
+    Cada worker de uvicorn tiene su propio PrinterService; el lease (un flock sobre
+    un archivo por impresora) garantiza que solo uno de ellos tenga abierta la
+    conexión TCP a la vez, de modo que los trabajos no se intercalen.
+    Se usa de forma síncrona, dentro del executor donde corre el socket.
+    """
+
+    POLL_INTERVAL = 0.05  # segundos entre intentos de flock
+
+    def __init__(self, host: str, port: int, lock_dir: str, timeout: float):
+        self.key = f"{host}:{port}"
+        self.path = lock_path(lock_dir, host, port, "lock")
+        self.lock_dir = lock_dir
+        self.timeout = timeout
+        self._fd: Optional[int] = None
+        self._thread_lock = _thread_lock_for(self.key)
+
+    def acquire(self) -> None:
+        deadline = time.monotonic() + self.timeout
+        if not self._thread_lock.acquire(timeout=self.timeout):
+            raise PrinterLeaseTimeout(
+                f"La impresora {self.key} está ocupada (timeout de {self.timeout}s)"
+            )
+        if fcntl is None:
+            return
+        try:
+            os.makedirs(self.lock_dir, exist_ok=True)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+            while True:
+                try:
+                    fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        raise PrinterLeaseTimeout(
+                            f"La impresora {self.key} está ocupada por otro worker "
+                            f"(timeout de {self.timeout}s)"
+                        )
+                    time.sleep(self.POLL_INTERVAL)
+        except BaseException:
+            self._close()
+            self._thread_lock.release()
+            raise
+
+    def release(self) -> None:
+        self._close()
+        self._thread_lock.release()
+
+    def _close(self) -> None:
+        if self._fd is not None:
+            # Cerrar el descriptor libera el flock
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self) -> "PrinterLease":
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.release()
@@ -0,0 +1,343 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from app.config import get_settings
+from app.models.label import JobPriority
+from app.services.events import EventBus, get_event_bus
+from app.services.idempotency import IdempotencyCache, IdempotencyKeyConflict, get_idempotency_cache
+from app.services.print_queue import DuplicateJobIdError, PrintDispatcher, QueueFullError, get_dispatcher
+from app.services.printer import PrinterConnectionError
+from app.services.printer_lock import PrinterOwnerLock, fcntl, lock_path
+
+logger = logging.getLogger(__name__)
+
+# Tamaño máximo de una línea del protocolo con el dueño (el ZPL va dentro); el
+# límite por defecto de asyncio (64 KiB) no alcanza para lotes /raw ni gráficos ^GF
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+
+
+class JobTooLargeError(Exception):
+    """El trabajo no cabe en un mensaje al worker dueño de la impresora"""
+    pass
+
+
+def _worker_count() -> int:
+    """Workers de uvicorn configurados (WEB_CONCURRENCY)"""
+    try:
+        return int(os.getenv("WEB_CONCURRENCY", "1"))
+    except ValueError:
+        return 1
+
+
+class LocalPrintClient:
+    """Acceso directo a la cola: se usa en el worker dueño de la impresora"""
+
+    def __init__(self, dispatcher: PrintDispatcher, events: EventBus, idempotency: IdempotencyCache):
+        self.dispatcher = dispatcher
+        self.events = events
+        self.idempotency = idempotency
+
+    async def print_job(
+        self,
+        zpl_code: str,
+        priority: JobPriority,
+        client_id: str,
+        idempotency_key: Optional[str] = None,
+        fingerprint: Optional[str] = None,
+        job_id: Optional[str] = None,
+    ) -> str:
+        """
+        Encola el ZPL, espera a que la impresora lo consuma y devuelve el id del trabajo
+        (`job_id` si el cliente lo eligió).
+
+        Con `idempotency_key` el trabajo se imprime una sola vez por clave; como la
+        caché vive en el dueño, la deduplicación vale para todos los workers.
+
+        Raises:
+            QueueFullError: Si el cliente alcanzó su límite de trabajos pendientes
+            PrinterConnectionError: Si la impresora no confirmó el trabajo
+            IdempotencyKeyConflict: Si la clave ya se usó con otra huella
+            DuplicateJobIdError: Si `job_id` ya pertenece a un trabajo sin terminar
+        """
+        async def submit_and_wait() -> str:
+            job = self.dispatcher.submit(zpl_code, priority=priority, client_id=client_id, job_id=job_id)
+            await job.wait()
+            return job.id
+
+        if not idempotency_key:
+            return await submit_and_wait()
+        return await self.idempotency.run(idempotency_key, fingerprint or "", submit_and_wait)
+
+    async def status(self) -> dict:
+        """Trabajos en cola y último estado conocido de la impresora"""
+        return {
+            "queued_jobs": self.dispatcher.pending(),
+            "printer_state": self.dispatcher.printer_state,
+        }
+
+    @asynccontextmanager
+    async def subscribe(self) -> AsyncIterator[asyncio.Queue]:
+        """Cola de eventos; None marca el fin del flujo"""
+        with self.events.subscribe() as queue:
+            # Con suscriptores el dispatcher vigila el estado aunque no haya trabajos
+            self.dispatcher.start()
+            yield queue
+
+
+class RemotePrintClient:
+    """
+    Reenvía los trabajos al worker dueño de la impresora por un socket Unix.
+
+    Protocolo: una línea JSON por petición ({"op": "print" | "status" | "events"})
+    y una línea JSON por respuesta o evento, de hasta MAX_MESSAGE_BYTES. La
+    Idempotency-Key viaja con el trabajo: la deduplicación la hace el dueño.
+    """
+
+    CONNECT_RETRIES = 20
+    CONNECT_RETRY_INTERVAL = 0.1  # segundos; cubre el relevo entre dueños
+
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+
+    async def _connect(self, message: dict) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        data = json.dumps(message).encode("utf-8") + b"\n"
+        if len(data) > MAX_MESSAGE_BYTES:
+            raise JobTooLargeError(
+                f"El trabajo ocupa {len(data)} bytes; el máximo es {MAX_MESSAGE_BYTES}"
+            )
+        for attempt in range(self.CONNECT_RETRIES):
+            try:
+                reader, writer = await asyncio.open_unix_connection(
+                    self.socket_path, limit=MAX_MESSAGE_BYTES
+                )
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if attempt == self.CONNECT_RETRIES - 1:
+                    raise PrinterConnectionError(
+                        "No hay un worker dueño de la impresora disponible"
+                    )
+                await asyncio.sleep(self.CONNECT_RETRY_INTERVAL)
+        writer.write(data)
+        await writer.drain()
+        return reader, writer
+
+    async def _request(self, message: dict) -> dict:
+        reader, writer = await self._connect(message)
+        try:
+            line = await reader.readline()
+        finally:
+            writer.close()
+        if not line:
+            raise PrinterConnectionError(
+                "Se perdió la conexión con el worker dueño de la impresora; "
+                "el trabajo puede haberse impreso"
+            )
+        return json.loads(line)
+
+    async def print_job(
+        self,
+        zpl_code: str,
+        priority: JobPriority,
+        client_id: str,
+        idempotency_key: Optional[str] = None,
+        fingerprint: Optional[str] = None,
+        job_id: Optional[str] = None,
+    ) -> str:
+        reply = await self._request({
+            "op": "print",
+            "zpl_code": zpl_code,
+            "priority": priority.value,
+            "client_id": client_id,
+            "idempotency_key": idempotency_key,
+            "fingerprint": fingerprint,
+            "job_id": job_id,
+        })
+        if reply["ok"]:
+            return reply["job_id"]
+        if reply["error"] == "queue_full":
+            raise QueueFullError(reply["detail"])
+        if reply["error"] == "conflict":
+            raise IdempotencyKeyConflict(reply["detail"])
+        if reply["error"] == "duplicate_job_id":
+            raise DuplicateJobIdError(reply["detail"])
+        if reply["error"] == "invalid":
+            raise JobTooLargeError(reply["detail"])
+        raise PrinterConnectionError(reply["detail"])
+
+    async def status(self) -> dict:
+        return await self._request({"op": "status"})
+
+    @asynccontextmanager
+    async def subscribe(self) -> AsyncIterator[asyncio.Queue]:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1000)
+        reader, writer = await self._connect({"op": "events"})
+
+        async def pump() -> None:
+            try:
+                while line := await reader.readline():
+                    if not line.strip():
+                        continue  # keepalive del dueño
+                    if queue.full():
+                        queue.get_nowait()
+                    queue.put_nowait(json.loads(line))
+            finally:
+                # El dueño terminó: el cliente SSE debe reconectar
+                if queue.full():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+        task = asyncio.get_running_loop().create_task(pump())
+        try:
+            yield queue
+        finally:
+            task.cancel()
+            writer.close()
+
+
+class PrinterOwnership:
+    """
+    Coordina qué worker es dueño de la impresora.
+
+    Con `--workers N` cada worker intenta obtener el PrinterOwnerLock; el que lo
+    consigue ejecuta el único PrintDispatcher (prioridades, reparto justo y control
+    de flujo en un solo lugar) y atiende a los demás por un socket Unix. Los demás
+    reenvían sus trabajos y, si el dueño muere, el primero que vuelva a intentarlo
+    toma el relevo. Sin flock ni sockets Unix (Windows) cada worker es su propio dueño.
+    """
+
+    KEEPALIVE_INTERVAL = 15  # segundos entre keepalives del flujo de eventos
+
+    def __init__(self, host: str, port: int, lock_dir: str):
+        self.socket_path = lock_path(lock_dir, host, port, "sock")
+        self._owner_lock = PrinterOwnerLock(host, port, lock_dir)
+        self._local: Optional[LocalPrintClient] = None
+        self._remote = RemotePrintClient(self.socket_path)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._shared = fcntl is not None and hasattr(socket, "AF_UNIX")
+        # Serializa la elección: dos primeras peticiones no deben abrir dos servidores
+        self._election = asyncio.Lock()
+
+    @property
+    def is_owner(self) -> bool:
+        return self._local is not None
+
+    async def client(self) -> "LocalPrintClient | RemotePrintClient":
+        """Cliente de impresión: local si este worker es (o pasa a ser) el dueño"""
+        if self._local is not None:
+            return self._local
+        async with self._election:
+            if self._local is not None:
+                return self._local
+            return await self._elect()
+
+    async def _elect(self) -> "LocalPrintClient | RemotePrintClient":
+        if not self._shared:
+            dispatcher = get_dispatcher()
+            if _worker_count() > 1 and dispatcher.max_in_flight > 0:
+                # Sin dueño único, ~HS mezclaría los formatos de todos los workers
+                logger.warning(
+                    "Sin flock/sockets Unix no hay dueño único de la impresora: "
+                    "control de flujo desactivado con %d workers", _worker_count(),
+                )
+                dispatcher.max_in_flight = 0
+            # Con persistencia, crear la caché lee su archivo: fuera del event loop
+            idempotency = await asyncio.to_thread(get_idempotency_cache)
+            self._local = LocalPrintClient(dispatcher, get_event_bus(), idempotency)
+            return self._local
+        if self._owner_lock.try_acquire():
+            idempotency = await asyncio.to_thread(get_idempotency_cache)
+            local = LocalPrintClient(get_dispatcher(), get_event_bus(), idempotency)
+            if os.path.exists(self.socket_path):
+                # Socket de un dueño anterior que ya no existe
+                os.unlink(self.socket_path)
+            self._server = await asyncio.start_unix_server(
+                lambda r, w: self._handle(local, r, w), path=self.socket_path, limit=MAX_MESSAGE_BYTES
+            )
+            self._local = local
+            logger.info("Este worker (pid %s) es el dueño de la impresora", os.getpid())
+            return local
+        return self._remote
+
+    async def _handle(self, local: LocalPrintClient, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            try:
+                line = await reader.readline()
+                if not line:
+                    return
+                message = json.loads(line)
+            except ValueError as e:
+                # Línea demasiado larga o JSON inválido: el trabajo no se encoló
+                logger.warning("Mensaje de worker rechazado: %s", e)
+                await self._write(writer, {
+                    "ok": False,
+                    "error": "invalid",
+                    "detail": f"El worker dueño rechazó el trabajo sin encolarlo: {e}",
+                })
+                return
+            op = message.get("op")
+            if op == "print":
+                reply = await self._serve_print(local, message)
+                await self._write(writer, reply)
+            elif op == "status":
+                await self._write(writer, await local.status())
+            elif op == "events":
+                await self._serve_events(local, writer)
+        except (ConnectionError, ValueError) as e:
+            logger.debug("Conexión de worker terminada: %s", e)
+        finally:
+            writer.close()
+
+    async def _serve_print(self, local: LocalPrintClient, message: dict) -> dict:
+        try:
+            job_id = await local.print_job(
+                message["zpl_code"],
+                JobPriority(message["priority"]),
+                message["client_id"],
+                idempotency_key=message.get("idempotency_key"),
+                fingerprint=message.get("fingerprint"),
+                job_id=message.get("job_id"),
+            )
+        except QueueFullError as e:
+            return {"ok": False, "error": "queue_full", "detail": str(e)}
+        except IdempotencyKeyConflict as e:
+            return {"ok": False, "error": "conflict", "detail": str(e)}
+        except DuplicateJobIdError as e:
+            return {"ok": False, "error": "duplicate_job_id", "detail": str(e)}
+        except PrinterConnectionError as e:
+            return {"ok": False, "error": "printer", "detail": str(e)}
+        return {"ok": True, "job_id": job_id}
+
+    async def _serve_events(self, local: LocalPrintClient, writer: asyncio.StreamWriter) -> None:
+        async with local.subscribe() as queue:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=self.KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    # Línea vacía: detecta si el worker suscrito se desconectó
+                    writer.write(b"\n")
+                    await writer.drain()
+                    continue
+                await self._write(writer, event)
+
+    async def _write(self, writer: asyncio.StreamWriter, payload: dict) -> None:
+        writer.write(json.dumps(payload).encode("utf-8") + b"\n")
+        await writer.drain()
+
+
+_ownership: Optional[PrinterOwnership] = None
+
+
+async def get_print_client() -> "LocalPrintClient | RemotePrintClient":
+    """Cliente de impresión del worker para la impresora configurada"""
+    global _ownership
+    if _ownership is None:
+        settings = get_settings()
+        _ownership = PrinterOwnership(
+            settings.host_ribetec_printer, settings.printer_port, settings.printer_lock_dir
+        )
+    return await _ownership.client()
@@ -0,0 +1,231 @@
+import unicodedata
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterable
+
+# Anchos de avance de la fuente 0 (CG Triumvirate Bold Condensed) en milésimas del
+# ancho de fuente de ^A0 (parámetro w), para ASCII imprimible (32..126).
+# Tabla aproximada (métricas de una sans-serif negrita condensada): suficiente para
+# decidir saltos de línea y reducción de fuente sin ir y venir con preview_only.
+_ASCII_WIDTHS = (
+    # espacio ! " # $ % & ' ( ) * + , - . /
+    236, 283, 403, 473, 473, 756, 614, 202, 283, 283, 331, 496, 236, 283, 236, 236,
+    # 0-9
+    473, 473, 473, 473, 473, 473, 473, 473, 473, 473,
+    # : ; < = > ? @
+    283, 283, 496, 496, 496, 519, 829,
+    # A-Z
+    614, 614, 614, 614, 567, 519, 661, 614, 236, 473, 614, 519, 708,
+    614, 661, 567, 661, 614, 567, 519, 614, 567, 802, 567, 567, 519,
+    # [ \ ] ^ _ `
+    283, 236, 283, 496, 473, 283,
+    # a-z
+    473, 519, 473, 519, 473, 283, 519, 519, 236, 236, 473, 236, 756,
+    519, 519, 519, 519, 331, 473, 283, 519, 473, 661, 473, 473, 425,
+    # { | } ~
+    331, 238, 331, 496,
+)
+_DEFAULT_WIDTH = 473
+
+# Marca de texto recortado; ASCII para no depender de la página de códigos de la fuente
+ELLIPSIS = "..."
+
+# Latin-1 y Latin Extended-A (ñ, acentos, etc.)
+_TABLE_SIZE = 0x180
+
+
+def _build_width_table() -> tuple[int, ...]:
+    """Ancho por codepoint; las letras acentuadas usan el ancho de su letra base"""
+    table = []
+    for codepoint in range(_TABLE_SIZE):
+        if 32 <= codepoint <= 126:
+            table.append(_ASCII_WIDTHS[codepoint - 32])
+            continue
+        base = unicodedata.normalize("NFD", chr(codepoint))[:1]
+        if base and 32 <= ord(base) <= 126:
+            table.append(_ASCII_WIDTHS[ord(base) - 32])
+        else:
+            table.append(_DEFAULT_WIDTH)
+    return tuple(table)
+
+
+WIDTH_TABLE = _build_width_table()
+
+
+def _char_units(char: str) -> int:
+    codepoint = ord(char)
+    return WIDTH_TABLE[codepoint] if codepoint < _TABLE_SIZE else _DEFAULT_WIDTH
+
+
+@lru_cache(maxsize=4096)
+def _text_units(text: str) -> int:
+    """Ancho del texto en milésimas del ancho de fuente"""
+    table = WIDTH_TABLE
+    size = _TABLE_SIZE
+    return sum(table[c] if c < size else _DEFAULT_WIDTH for c in map(ord, text))
+
+
+def text_width(text: str, font_width: int) -> int:
+    """Ancho en dots de `text` con ^A0N,h,`font_width`"""
+    return _text_units(text) * font_width // 1000
+
+
+def measure_many(texts: Iterable[str], font_width: int) -> list[int]:
+    """Anchos en dots de varios textos en una sola pasada"""
+    return [_text_units(text) * font_width // 1000 for text in texts]
+
+
+@dataclass
+class MeasuredText:
+    """
+    Texto partido en párrafos y palabras, con el ancho de cada palabra en milésimas
+    del ancho de fuente. Se mide una vez y sirve para cualquier tamaño: al reducir
+    la fuente solo se reescalan los anchos.
+    """
+    text: str
+    paragraphs: list[list[tuple[str, int]]]
+
+
+def measure_texts(texts: Iterable[str]) -> list[MeasuredText]:
+    """Mide todas las palabras de varios textos en una sola pasada por WIDTH_TABLE"""
+    table = WIDTH_TABLE
+    size = _TABLE_SIZE
+    measured = []
+    for text in texts:
+        paragraphs = [
+            [
+                (word, sum(table[c] if c < size else _DEFAULT_WIDTH for c in map(ord, word)))
+                for word in paragraph.split()
+            ]
+            for paragraph in text.split("\n")
+        ]
+        measured.append(MeasuredText(text, paragraphs))
+    return measured
+
+
+@dataclass
+class TextLayout:
+    """Resultado de maquetar un texto dentro de un bloque"""
+    lines: list[str]
+    font_size: int
+    font_width: int
+    block_width: int
+    truncated: bool = False  # no cupo todo: la última línea termina en ELLIPSIS
+
+    @property
+    def height(self) -> int:
+        """Alto ocupado en dots"""
+        return len(self.lines) * self.font_size
+
+
+def wrap_text(text: "str | MeasuredText", font_width: int, max_width: int) -> list[str]:
+    """Parte el texto en líneas que caben en `max_width` (corta palabras demasiado largas)"""
+    return _wrap(_measured(text), font_width, max_width)[0]
+
+
+def _measured(text: "str | MeasuredText") -> MeasuredText:
+    return text if isinstance(text, MeasuredText) else measure_texts([text])[0]
+
+
+def _wrap(text: MeasuredText, font_width: int, max_width: int) -> tuple[list[str], bool]:
+    """Como wrap_text, e indica si hubo que cortar alguna palabra"""
+    lines: list[str] = []
+    split = False
+    space = _char_units(" ") * font_width // 1000
+    for words in text.paragraphs:
+        if not words:
+            lines.append("")
+            continue
+        current = ""
+        current_width = 0
+        for word, units in words:
+            width = units * font_width // 1000
+            if width > max_width:
+                # Palabra más ancha que el bloque: se corta carácter a carácter
+                split = True
+                if current:
+                    lines.append(current)
+                pieces = _split_word(word, font_width, max_width)
+                lines.extend(piece for piece, _ in pieces[:-1])
+                current, current_width = pieces[-1]
+            elif not current:
+                current, current_width = word, width
+            elif current_width + space + width <= max_width:
+                current += " " + word
+                current_width += space + width
+            else:
+                lines.append(current)
+                current, current_width = word, width
+        lines.append(current)
+    return lines, split
+
+
+def _split_word(word: str, font_width: int, max_width: int) -> list[tuple[str, int]]:
+    """Trozos de la palabra que caben en `max_width`, con su ancho en dots"""
+    pieces = []
+    start = 0
+    units = 0
+    for index, char in enumerate(word):
+        char_units = _char_units(char)
+        # Ancho acumulado del trozo: cada carácter se mide una sola vez
+        if index > start and (units + char_units) * font_width // 1000 > max_width:
+            pieces.append((word[start:index], units * font_width // 1000))
+            start, units = index, char_units
+        else:
+            units += char_units
+    pieces.append((word[start:], units * font_width // 1000))
+    return pieces
+
+
+def _ellipsize(line: str, font_width: int, max_width: int) -> str:
+    """Recorta la línea lo justo para que quepa con ELLIPSIS al final"""
+    line = line.rstrip()
+    budget = _text_units(ELLIPSIS)
+    end = 0
+    units = 0
+    for index, char in enumerate(line, start=1):
+        units += _char_units(char)
+        if (units + budget) * font_width // 1000 > max_width:
+            break
+        end = index
+    return line[:end].rstrip() + ELLIPSIS
+
+
+def fit_text(
+    text: "str | MeasuredText",
+    font_size: int,
+    font_width: int,
+    max_width: int,
+    max_lines: int = 1,
+    shrink: bool = False,
+    min_font_size: int = 10,
+) -> TextLayout:
+    """
+    Maqueta el texto en un bloque de `max_width` dots y hasta `max_lines` líneas.
+
+    Con `shrink`, reduce la fuente (manteniendo la proporción alto/ancho) hasta que
+    el texto quepa sin cortar palabras o se llegue a `min_font_size`; solo a ese
+    tamaño se cortan carácter a carácter. Si aun así no cabe, la última línea
+    termina en ELLIPSIS y el resultado queda marcado como `truncated`.
+    Acepta un MeasuredText para no volver a medir lo que ya se midió.
+    """
+    measured = _measured(text)
+    ratio = font_width / font_size
+    size = font_size
+    while True:
+        width = max(1, round(size * ratio))
+        lines, split = _wrap(measured, width, max_width)
+        fits = len(lines) <= max_lines and not (shrink and split)
+        if fits or not shrink or size <= min_font_size:
+            truncated = len(lines) > max_lines
+            lines = lines[:max_lines]
+            if truncated:
+                lines[-1] = _ellipsize(lines[-1], width, max_width)
+            return TextLayout(
+                lines=lines,
+                font_size=size,
+                font_width=width,
+                block_width=max_width,
+                truncated=truncated,
+            )
+        size = max(min_font_size, size - max(1, size // 20))
@@ -1,3 +1,5 @@
+from typing import Iterable
+
 from app.models.label import (
     LabelRequest,
     SimpleLabelRequest,
@@ -9,6 +11,7 @@ from app.models.label import (
     LabelSize,
     TextAlignment,
 )
+from app.services.text_layout import MeasuredText, TextLayout, fit_text, measure_texts
 
 
 class ZPLGenerator:
@@ -24,8 +27,20 @@ class ZPLGenerator:
         LabelSize.LARGE: (100, 50),
     }
 
+    # Justificación de ^FB según la alineación
+    FB_JUSTIFICATION = {
+        TextAlignment.LEFT: "L",
+        TextAlignment.CENTER: "C",
+        TextAlignment.RIGHT: "R",
+    }
+
     def __init__(self):
         self.zpl_commands: list[str] = []
+        self.label_width_dots = 0
+        # Avisos de la última etiqueta generada (p. ej. textos recortados)
+        self.warnings: list[str] = []
+        # Textos de la etiqueta medidos de una vez (texto -> palabras con su ancho)
+        self._measured: dict[str, MeasuredText] = {}
 
     def _mm_to_dots(self, mm: int) -> int:
         """Convierte milímetros a dots"""
@@ -35,6 +50,9 @@ class ZPLGenerator:
         """Inicia una nueva etiqueta"""
         width_dots = self._mm_to_dots(width_mm)
         height_dots = self._mm_to_dots(height_mm)
+        self.label_width_dots = width_dots
+        self.warnings = []
+        self._measured = {}
 
         self.zpl_commands = [
             "^XA",  # Inicio de formato
@@ -51,18 +69,64 @@ class ZPLGenerator:
         self.zpl_commands.append(f"^PQ{copies}")  # Cantidad de copias
         self.zpl_commands.append("^XZ")  # Fin de formato
 
-    def _add_text(self, element: TextElement) -> None:
-        """Añade un elemento de texto"""
+    def _font_width(self, element: TextElement) -> int:
+        """Ancho de fuente para ^A0N"""
+        if element.bold:
+            # Ancho mayor que alto simula negrita
+            return int(element.font_size * 1.2)
+        return element.font_size
+
+    def _needs_layout(self, element: TextElement) -> bool:
+        """El texto necesita bloque ^FB (alineación, ajuste o reducción)"""
+        return (
+            element.alignment != TextAlignment.LEFT
+            or element.max_width is not None
+            or element.max_lines > 1
+            or element.auto_shrink
+        )
+
+    def _measure_texts(self, texts: Iterable[str]) -> None:
+        """Mide en una sola pasada todos los textos de la etiqueta que necesitan bloque"""
+        texts = list(dict.fromkeys(texts))
+        self._measured = dict(zip(texts, measure_texts(texts)))
+
+    def _layout_text(self, element: TextElement) -> TextLayout:
+        """Mide y ajusta el texto al bloque disponible"""
+        block_width = element.max_width or max(1, self.label_width_dots - element.x)
+        return fit_text(
+            self._measured.get(element.text, element.text),
+            element.font_size,
+            self._font_width(element),
+            block_width,
+            max_lines=element.max_lines,
+            shrink=element.auto_shrink,
+            min_font_size=min(element.min_font_size, element.font_size),
+        )
+
+    def _add_text(self, element: TextElement) -> int:
+        """Añade un elemento de texto y devuelve el alto ocupado en dots"""
         self.zpl_commands.append(f"^FO{element.x},{element.y}")
         # ^A0N = Fuente escalable, orientación Normal
         # Para simular negrita, aumentamos ligeramente el ancho de la fuente
-        if element.bold:
-            # Ancho mayor que alto simula negrita
-            font_width = int(element.font_size * 1.2)
-            self.zpl_commands.append(f"^A0N,{element.font_size},{font_width}")
-        else:
-            self.zpl_commands.append(f"^A0N,{element.font_size},{element.font_size}")
-        self.zpl_commands.append(f"^FD{element.text}^FS")
+        if not self._needs_layout(element):
+            self.zpl_commands.append(f"^A0N,{element.font_size},{self._font_width(element)}")
+            self.zpl_commands.append(f"^FD{element.text}^FS")
+            return element.font_size
+
+        layout = self._layout_text(element)
+        if layout.truncated:
+            preview = element.text if len(element.text) <= 40 else element.text[:40] + "..."
+            self.warnings.append(
+                f"El texto '{preview}' no cabe en {element.max_lines} línea(s) "
+                f"de {layout.block_width} dots y se recortó"
+            )
+        self.zpl_commands.append(f"^A0N,{layout.font_size},{layout.font_width}")
+        # ^FB ancho,líneas,espaciado,justificación: las líneas ya vienen partidas (\&)
+        justification = self.FB_JUSTIFICATION[element.alignment]
+        self.zpl_commands.append(f"^FB{layout.block_width},{len(layout.lines)},0,{justification},0")
+        text = "\\&".join(line.replace("\\", "\\\\") for line in layout.lines)
+        self.zpl_commands.append(f"^FD{text}^FS")
+        return layout.height
 
     def _add_barcode(self, element: BarcodeElement) -> None:
         """Añade un código de barras"""
@@ -135,6 +199,7 @@ class ZPLGenerator:
         self._start_label(request.label_width_mm, request.label_height_mm)
 
         # Añadir todos los elementos
+        self._measure_texts(text.text for text in request.texts if self._needs_layout(text))
         for text in request.texts:
             self._add_text(text)
 
@@ -163,29 +228,38 @@ class ZPLGenerator:
         self._start_label(width_mm, height_mm)
 
         current_y = 30
+        margin_x = 50
+        text_width = max(1, self.label_width_dots - 2 * margin_x)
 
-        # Título
+        # Título: hasta 2 líneas, reduciendo la fuente si no cabe
         title_element = TextElement(
-            x=50,
+            x=margin_x,
             y=current_y,
             text=request.title,
             font_size=60,
-            bold=True
+            bold=True,
+            max_width=text_width,
+            max_lines=2,
+            auto_shrink=True,
+            min_font_size=30,
         )
-        self._add_text(title_element)
-        current_y += 50
+        self._measure_texts(text for text in (request.title, request.subtitle) if text)
+        current_y += self._add_text(title_element) + 10
 
         # Subtítulo
         if request.subtitle:
             subtitle_element = TextElement(
-                x=50,
+                x=margin_x,
                 y=current_y,
                 text=request.subtitle,
                 font_size=45,
-                bold=False
+                bold=False,
+                max_width=text_width,
+                max_lines=2,
+                auto_shrink=True,
+                min_font_size=25,
             )
-            self._add_text(subtitle_element)
-            current_y += 40
+            current_y += self._add_text(subtitle_element) + 10
 
         # Código de barras
         if request.barcode_data:
@@ -0,0 +1,112 @@
+import asyncio
+import socket
+from typing import Optional
+
+import pytest
+
+from app.services import printer_owner
+from app.services.events import EventBus
+from app.services.idempotency import IdempotencyCache
+from app.services.print_queue import PrintDispatcher
+from app.services.printer import HostStatus
+from app.services.printer_lock import fcntl
+
+
+def host_status(formats_in_buffer: int = 0, labels_remaining: int = 0, **flags) -> HostStatus:
+    """HostStatus con todo en orden salvo lo indicado"""
+    return HostStatus(
+        paper_out=flags.get("paper_out", False),
+        paused=flags.get("paused", False),
+        formats_in_buffer=formats_in_buffer,
+        buffer_full=flags.get("buffer_full", False),
+        head_up=flags.get("head_up", False),
+        ribbon_out=flags.get("ribbon_out", False),
+        labels_remaining=labels_remaining,
+    )
+
+
+class FakePrinter:
+    """
+    Impresora simulada para el dispatcher.
+
+    Guarda los documentos recibidos y, en cada consulta ~HS, consume un formato del
+    buffer. `status_replies` fuerza las siguientes respuestas (HostStatus o excepción);
+    con `stuck` el buffer nunca se vacía y con `gate` cada envío espera a ese evento.
+    """
+
+    def __init__(self, status_replies: Optional[list] = None, stuck: bool = False):
+        self.sent: list[str] = []
+        self.buffer = 0
+        self.max_buffer = 0
+        self.queries = 0
+        self.status_replies = list(status_replies or [])
+        self.stuck = stuck
+        self.on_send = None
+        self.gate: Optional[asyncio.Event] = None
+
+    async def send_zpl(self, zpl_code: str) -> bool:
+        await asyncio.sleep(0)
+        if self.gate is not None:
+            await self.gate.wait()
+        self.sent.append(zpl_code)
+        self.buffer += 1
+        self.max_buffer = max(self.max_buffer, self.buffer)
+        if self.on_send is not None:
+            self.on_send(zpl_code)
+        return True
+
+    async def query_host_status(self) -> HostStatus:
+        self.queries += 1
+        await asyncio.sleep(0)
+        if self.status_replies:
+            reply = self.status_replies.pop(0)
+            if isinstance(reply, Exception):
+                raise reply
+            return reply
+        if not self.stuck:
+            self.buffer = max(0, self.buffer - 1)
+        return host_status(formats_in_buffer=self.buffer)
+
+
+@pytest.fixture
+def make_dispatcher():
+    """Crea un PrintDispatcher rápido (sin esperas entre consultas) sobre una FakePrinter"""
+
+    def factory(printer: FakePrinter, max_in_flight: int = 0, max_per_client: int = 100, **attrs) -> PrintDispatcher:
+        dispatcher = PrintDispatcher(
+            printer=printer,
+            max_per_client=max_per_client,
+            max_in_flight=max_in_flight,
+            events=EventBus(),
+        )
+        dispatcher.poll_interval = 0
+        dispatcher.stall_timeout = 5
+        dispatcher.max_status_failures = 3
+        for name, value in attrs.items():
+            setattr(dispatcher, name, value)
+        return dispatcher
+
+    return factory
+
+
+@pytest.fixture
+def ownership(tmp_path, monkeypatch):
+    """
+    Dos PrinterOwnership sobre el mismo directorio de locks, como dos workers:
+    el primero en pedir cliente es el dueño y el otro le reenvía por el socket.
+    """
+    if fcntl is None or not hasattr(socket, "AF_UNIX"):
+        pytest.skip("requiere flock y sockets Unix")
+
+    def factory(dispatcher: PrintDispatcher, cache: Optional[IdempotencyCache] = None):
+        monkeypatch.setattr(printer_owner, "get_dispatcher", lambda: dispatcher)
+        monkeypatch.setattr(printer_owner, "get_event_bus", lambda: dispatcher.events)
+        monkeypatch.setattr(
+            printer_owner, "get_idempotency_cache", lambda: cache or IdempotencyCache(100, 60)
+        )
+        return (
+            printer_owner.PrinterOwnership("printer", 9100, str(tmp_path)),
+            printer_owner.PrinterOwnership("printer", 9100, str(tmp_path)),
+        )
+
+    return factory
@@ -0,0 +1,169 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.routers import print as print_router
+from app.services.events import EventBus
+from app.services.printer_owner import RemotePrintClient
+
+
+def test_publish_reaches_every_subscriber():
+    bus = EventBus()
+
+    async def main():
+        with bus.subscribe() as first, bus.subscribe() as second:
+            assert bus.has_subscribers()
+            event = bus.publish("queued", job_id="j1")
+            return event, first.get_nowait(), second.get_nowait()
+
+    event, first, second = asyncio.run(main())
+    assert first is event and second is event
+    assert event["type"] == "queued" and event["job_id"] == "j1"
+    assert not bus.has_subscribers()
+
+
+def test_slow_subscriber_drops_oldest_events():
+    bus = EventBus(max_queue=2)
+
+    async def main():
+        with bus.subscribe() as queue:
+            for i in range(4):
+                bus.publish("flushed", document=i)
+            return [queue.get_nowait()["document"] for _ in range(queue.qsize())]
+
+    assert asyncio.run(main()) == [2, 3]
+
+
+def test_unsubscribed_queue_gets_nothing():
+    bus = EventBus()
+
+    async def main():
+        with bus.subscribe() as queue:
+            pass
+        bus.publish("queued")
+        return queue.empty()
+
+    assert asyncio.run(main())
+
+
+def test_event_ids_increase():
+    bus = EventBus()
+    assert [bus.publish("x")["id"] for _ in range(3)] == [1, 2, 3]
+
+
+class FakeEventsClient:
+    """Cliente de impresión que entrega una lista fija de eventos (None cierra el flujo)"""
+
+    def __init__(self, events, delay=0.0):
+        self.events = events
+        self.delay = delay
+
+    @asynccontextmanager
+    async def subscribe(self):
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def feed():
+            await asyncio.sleep(self.delay)
+            for event in self.events:
+                queue.put_nowait(event)
+
+        task = asyncio.get_running_loop().create_task(feed())
+        try:
+            yield queue
+        finally:
+            task.cancel()
+
+
+@pytest.fixture
+def sse(monkeypatch):
+    """GET /print/events contra un FakeEventsClient; devuelve la respuesta completa"""
+
+    def request(events, delay=0.0, **params):
+        async def get_print_client():
+            return FakeEventsClient(events, delay)
+
+        monkeypatch.setattr(print_router, "get_print_client", get_print_client)
+        app = FastAPI()
+        app.include_router(print_router.router)
+        with TestClient(app) as client:
+            return client.get("/print/events", params=params)
+
+    return request
+
+
+def parse_sse(body: str) -> list[dict]:
+    """Eventos SSE del cuerpo: campos id/event/data de cada bloque"""
+    events = []
+    for block in body.split("\n\n"):
+        if not block or block.startswith(":"):
+            continue
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        fields["data"] = json.loads(fields["data"])
+        events.append(fields)
+    return events
+
+
+EVENTS = [
+    {"id": 1, "type": "queued", "job_id": "a", "client_id": "tienda"},
+    {"id": 2, "type": "printer_state", "online": True, "paper_out": False},
+    {"id": 3, "type": "queued", "job_id": "b", "client_id": "almacen"},
+    {"id": 4, "type": "consumed", "job_id": "a", "client_id": "tienda"},
+    None,
+]
+
+
+def test_sse_framing(sse):
+    response = sse(EVENTS)
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.headers["cache-control"] == "no-cache"
+    blocks = parse_sse(response.text)
+    assert [(b["id"], b["event"]) for b in blocks] == [
+        ("1", "queued"), ("2", "printer_state"), ("3", "queued"), ("4", "consumed"),
+    ]
+    assert blocks[0]["data"] == EVENTS[0]
+
+
+def test_sse_job_filter_keeps_printer_state(sse):
+    blocks = parse_sse(sse(EVENTS, job_id="a").text)
+    assert [b["event"] for b in blocks] == ["queued", "printer_state", "consumed"]
+
+
+def test_sse_client_filter(sse):
+    blocks = parse_sse(sse(EVENTS, client_id="almacen").text)
+    assert [(b["event"], b["data"].get("job_id")) for b in blocks] == [
+        ("printer_state", None), ("queued", "b"),
+    ]
+
+
+def test_sse_keepalive_while_idle(sse, monkeypatch):
+    monkeypatch.setattr(print_router, "SSE_KEEPALIVE_INTERVAL", 0.01)
+    response = sse([EVENTS[0], None], delay=0.1)
+    assert response.text.startswith(": keepalive\n\n")
+    assert [b["event"] for b in parse_sse(response.text)] == ["queued"]
+
+
+def test_remote_subscription_ends_with_none(tmp_path):
+    socket_path = str(tmp_path / "owner.sock")
+
+    async def owner(reader, writer):
+        await reader.readline()
+        writer.write(json.dumps({"id": 1, "type": "queued"}).encode() + b"\n")
+        writer.write(b"\n")  # keepalive del dueño
+        writer.write(json.dumps({"id": 2, "type": "consumed"}).encode() + b"\n")
+        await writer.drain()
+        writer.close()
+
+    async def main():
+        server = await asyncio.start_unix_server(owner, path=socket_path)
+        received = []
+        async with RemotePrintClient(socket_path).subscribe() as queue:
+            while (event := await asyncio.wait_for(queue.get(), timeout=2)) is not None:
+                received.append(event["type"])
+        server.close()
+        return received
+
+    assert asyncio.run(main()) == ["queued", "consumed"]
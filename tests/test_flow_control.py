@@ -0,0 +1,184 @@
+import asyncio
+
+import pytest
+
+from app.models.label import JobPriority
+from app.services.print_queue import split_documents
+from app.services.printer import (
+    PrinterConnectionError,
+    PrinterStatusNoReply,
+    PrinterStatusUnsupported,
+)
+
+from tests.conftest import FakePrinter, host_status
+
+
+def collect(dispatcher) -> list[dict]:
+    """Suscribe una lista a los eventos del dispatcher"""
+    events: list[dict] = []
+    original = dispatcher.events.publish
+
+    def publish(event_type, **data):
+        events.append({"type": event_type, **data})
+        original(event_type, **data)
+
+    dispatcher.events.publish = publish
+    return events
+
+
+def test_split_documents():
+    assert split_documents("^XAa^XZ\n^xab^xz\n") == ["^XAa^XZ", "\n^xab^xz"]
+    assert split_documents("^XAa^XZ") == ["^XAa^XZ"]
+    # Sin ^XZ el trabajo se envía tal cual
+    assert split_documents("~JA") == ["~JA"]
+
+
+def test_in_flight_limit_and_consumed_events(make_dispatcher):
+    printer = FakePrinter()
+
+    async def main():
+        dispatcher = make_dispatcher(printer, max_in_flight=2)
+        events = collect(dispatcher)
+        jobs = [dispatcher.submit(f"^XA{i}^XZ", client_id="a") for i in range(5)]
+        await asyncio.gather(*(job.wait() for job in jobs))
+        return dispatcher, events, jobs
+
+    dispatcher, events, jobs = asyncio.run(main())
+    assert printer.max_buffer <= 2
+    assert len(printer.sent) == 5
+    assert dispatcher.max_in_flight == 2
+    first = [e["type"] for e in events if e.get("job_id") == jobs[0].id]
+    assert first == ["queued", "sent", "flushed", "consumed"]
+
+
+def test_job_not_done_until_printer_consumes_it(make_dispatcher):
+    # Sondeo inicial, y luego la impresora retiene el formato dos consultas
+    printer = FakePrinter(status_replies=[
+        host_status(),
+        host_status(formats_in_buffer=1),
+        host_status(labels_remaining=3),
+    ])
+
+    async def main():
+        dispatcher = make_dispatcher(printer, max_in_flight=2)
+        job = dispatcher.submit("^XAx^XZ")
+        while printer.queries < 3:
+            assert not job.future.done()
+            await asyncio.sleep(0)
+        await job.wait()
+        return job
+
+    job = asyncio.run(main())
+    assert job.documents_consumed == 1
+
+
+def test_stall_fails_unconfirmed_jobs(make_dispatcher):
+    printer = FakePrinter(stuck=True)
+
+    async def main():
+        dispatcher = make_dispatcher(printer, max_in_flight=2, stall_timeout=0.05)
+        job = dispatcher.submit("^XAa^XZ^XAb^XZ")
+        with pytest.raises(PrinterConnectionError, match="documentos confirmados: 0 de 2"):
+            await job.wait()
+
+    asyncio.run(main())
+
+
+def test_halted_printer_is_not_a_stall(make_dispatcher):
+    paper_out = host_status(formats_in_buffer=1, paper_out=True)
+    printer = FakePrinter(status_replies=[host_status()] + [paper_out] * 20)
+
+    async def main():
+        dispatcher = make_dispatcher(printer, max_in_flight=2, stall_timeout=0.02, poll_interval=0.005)
+        # Sin papel más tiempo que stall_timeout: el trabajo espera, no falla
+        assert await dispatcher.submit("^XAx^XZ").wait()
+
+    asyncio.run(main())
+
+
+def test_printer_without_host_status_disables_flow_control(make_dispatcher):
+    printer = FakePrinter(status_replies=[PrinterStatusUnsupported("?")] * 3)
+
+    async def main():
+        dispatcher = make_dispatcher(printer, max_in_flight=2)
+        assert await dispatcher.submit("^XAx^XZ").wait()
+        return dispatcher
+
+    dispatcher = asyncio.run(main())
+    assert dispatcher.max_in_flight == 0
+    assert printer.sent == ["^XAx^XZ"]
+
+
+def test_no_reply_after_support_is_transient(make_dispatcher):
+    printer = FakePrinter(status_replies=[
+        host_status(),
+        PrinterStatusNoReply("timeout"),
+        PrinterStatusNoReply("timeout"),
+        PrinterStatusNoReply("timeout"),
+        PrinterStatusNoReply("timeout"),
+    ])
+
+    async def main():
+        dispatcher = make_dispatcher(printer, max_in_flight=2)
+        assert await dispatcher.submit("^XAx^XZ").wait()
+        return dispatcher
+
+    dispatcher = asyncio.run(main())
+    assert dispatcher.max_in_flight == 2
+
+
+def test_malformed_replies_after_support_fail_in_flight(make_dispatcher):
+    printer = FakePrinter(
+        status_replies=[host_status()] + [PrinterStatusUnsupported("?")] * 3,
+        stuck=True,
+    )
+
+    async def main():
+        dispatcher = make_dispatcher(printer, max_in_flight=2)
+        with pytest.raises(PrinterConnectionError, match="~HS no disponible"):
+            await dispatcher.submit("^XAx^XZ").wait()
+        return dispatcher
+
+    dispatcher = asyncio.run(main())
+    assert dispatcher.max_in_flight == 0
+
+
+def test_urgent_job_interleaves_at_document_boundary(make_dispatcher):
+    printer = FakePrinter()
+
+    async def main():
+        dispatcher = make_dispatcher(printer, max_in_flight=2)
+        bulk = dispatcher.submit("^XAb1^XZ^XAb2^XZ^XAb3^XZ", JobPriority.BULK, "lote")
+        urgent = []
+
+        def submit_urgent(document):
+            if not urgent:
+                urgent.append(dispatcher.submit("^XAu^XZ", JobPriority.URGENT, "mostrador"))
+
+        printer.on_send = submit_urgent
+        await bulk.wait()
+        await urgent[0].wait()
+        return bulk
+
+    bulk = asyncio.run(main())
+    assert printer.sent == ["^XAb1^XZ", "^XAu^XZ", "^XAb2^XZ", "^XAb3^XZ"]
+    assert bulk.documents_consumed == 3
+
+
+def test_no_reply_at_probe_suspends_flow_control_until_reprobe(make_dispatcher):
+    printer = FakePrinter(status_replies=[PrinterStatusNoReply("timeout")] * 3)
+
+    async def main():
+        dispatcher = make_dispatcher(printer, max_in_flight=2, reprobe_interval=60)
+        assert await dispatcher.submit("^XAa^XZ").wait()
+        # Ocupada en el sondeo: sin control de flujo por ahora, pero no para siempre
+        suspended = (dispatcher.max_in_flight, dispatcher._status_supported)
+        dispatcher._reprobe_at = 0
+        assert await dispatcher.submit("^XAb^XZ").wait()
+        return suspended, dispatcher
+
+    suspended, dispatcher = asyncio.run(main())
+    assert suspended == (0, None)
+    assert dispatcher.max_in_flight == 2
+    assert dispatcher._status_supported is True
+    assert printer.sent == ["^XAa^XZ", "^XAb^XZ"]
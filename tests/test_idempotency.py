@@ -0,0 +1,213 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+from app.models.label import JobPriority
+from app.services import idempotency
+from app.services.idempotency import IdempotencyCache, IdempotencyKeyConflict
+
+from tests.conftest import FakePrinter
+
+
+class Counter:
+    """Función asíncrona que cuenta sus llamadas"""
+
+    def __init__(self, result="job-1", delay=0.0, error=None):
+        self.calls = 0
+        self.result = result
+        self.delay = delay
+        self.error = error
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def test_repeated_key_returns_original_result():
+    cache = IdempotencyCache(max_entries=10, ttl=60)
+    func = Counter()
+
+    async def main():
+        return [await cache.run("k", "f", func) for _ in range(3)]
+
+    assert asyncio.run(main()) == ["job-1"] * 3
+    assert func.calls == 1
+
+
+def test_same_key_with_other_request_conflicts():
+    cache = IdempotencyCache(max_entries=10, ttl=60)
+
+    async def main():
+        await cache.run("k", "f", Counter())
+        with pytest.raises(IdempotencyKeyConflict):
+            await cache.run("k", "otra", Counter())
+
+    asyncio.run(main())
+
+
+def test_concurrent_retry_waits_for_the_same_job():
+    cache = IdempotencyCache(max_entries=10, ttl=60)
+    func = Counter(delay=0.01)
+
+    async def main():
+        return await asyncio.gather(cache.run("k", "f", func), cache.run("k", "f", func))
+
+    assert asyncio.run(main()) == ["job-1", "job-1"]
+    assert func.calls == 1
+
+
+def test_failures_are_not_cached():
+    cache = IdempotencyCache(max_entries=10, ttl=60)
+
+    async def main():
+        with pytest.raises(OSError):
+            await cache.run("k", "f", Counter(error=OSError("sin conexión")))
+        return await cache.run("k", "f", Counter(result="job-2"))
+
+    assert asyncio.run(main()) == "job-2"
+
+
+def test_ttl_and_lru_eviction(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(idempotency.time, "time", lambda: now[0])
+    cache = IdempotencyCache(max_entries=2, ttl=60)
+
+    async def main():
+        for key in ("a", "b", "c"):
+            await cache.run(key, "f", Counter(result=key))
+
+    asyncio.run(main())
+    # "a" salió por LRU al entrar "c"
+    assert cache.get("a", "f") is None
+    assert cache.get("c", "f") == "c"
+    now[0] += 61
+    assert cache.get("c", "f") is None
+    assert len(cache) == 1  # "b" expiró pero sigue hasta la próxima escritura
+
+
+def test_persistence_survives_restart(tmp_path):
+    path = str(tmp_path / "idempotency.jsonl")
+    func = Counter()
+
+    async def main():
+        first = IdempotencyCache(max_entries=10, ttl=60, persist_path=path)
+        await first.run("k", "f", func)
+        first.flush()
+        return await IdempotencyCache(max_entries=10, ttl=60, persist_path=path).run("k", "f", func)
+
+    assert asyncio.run(main()) == "job-1"
+    assert func.calls == 1
+
+
+def test_compaction_keeps_entries_of_other_writers(tmp_path):
+    path = str(tmp_path / "idempotency.jsonl")
+    previous_owner = IdempotencyCache(max_entries=10, ttl=60, persist_path=path)
+    owner = IdempotencyCache(max_entries=10, ttl=60, persist_path=path)
+
+    async def main():
+        await previous_owner.run("a", "f", Counter(result="a"))
+        await owner.run("b", "f", Counter(result="b"))
+        await owner.run("b", "f", Counter(result="b"))
+
+    asyncio.run(main())
+    previous_owner.flush()
+    owner.flush()
+    # Al arrancar se compacta el archivo: quedan las entradas de ambos, una vez cada una
+    restarted = IdempotencyCache(max_entries=10, ttl=60, persist_path=path)
+    assert restarted.get("a", "f") == "a"
+    assert restarted.get("b", "f") == "b"
+    with open(path, encoding="utf-8") as f:
+        keys = [json.loads(line)["key"] for line in f]
+    assert sorted(keys) == ["a", "b"]
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_compaction_keeps_the_newest_entries(tmp_path):
+    path = str(tmp_path / "idempotency.jsonl")
+    previous_owner = IdempotencyCache(max_entries=2, ttl=60, persist_path=path)
+    owner = IdempotencyCache(max_entries=2, ttl=60, persist_path=path)
+
+    async def main():
+        await previous_owner.run("old", "f", Counter(result="old"))
+        # La quinta escritura supera 2 * max_entries y dispara la compactación
+        for key in ("b", "c", "d", "e", "f"):
+            await owner.run(key, "f", Counter(result=key))
+
+    asyncio.run(main())
+    owner.flush()
+    assert owner.get("e", "f") == "e"
+    assert owner.get("f", "f") == "f"
+    with open(path, encoding="utf-8") as f:
+        assert [json.loads(line)["key"] for line in f] == ["e", "f"]
+
+
+def test_expired_entries_are_dropped_on_load(tmp_path, monkeypatch):
+    path = str(tmp_path / "idempotency.jsonl")
+    now = [1000.0]
+    monkeypatch.setattr(idempotency.time, "time", lambda: now[0])
+
+    cache = IdempotencyCache(max_entries=10, ttl=60, persist_path=path)
+
+    async def main():
+        await cache.run("k", "f", Counter())
+
+    asyncio.run(main())
+    cache.flush()
+    now[0] += 61
+    assert len(IdempotencyCache(max_entries=10, ttl=60, persist_path=path)) == 0
+    with open(path, encoding="utf-8") as f:
+        assert f.read() == ""
+
+
+def test_retry_on_another_worker_is_deduplicated(make_dispatcher, ownership):
+    printer = FakePrinter()
+
+    async def main():
+        dispatcher = make_dispatcher(printer)
+        owner, other = ownership(dispatcher, IdempotencyCache(max_entries=10, ttl=60))
+        owner_client = await owner.client()
+        remote_client = await other.client()
+        first = await owner_client.print_job(
+            "^XAx^XZ", JobPriority.NORMAL, "a", idempotency_key="/print/raw:k", fingerprint="f"
+        )
+        retry = await remote_client.print_job(
+            "^XAx^XZ", JobPriority.NORMAL, "a", idempotency_key="/print/raw:k", fingerprint="f"
+        )
+        with pytest.raises(IdempotencyKeyConflict):
+            await remote_client.print_job(
+                "^XAy^XZ", JobPriority.NORMAL, "a", idempotency_key="/print/raw:k", fingerprint="g"
+            )
+        owner._server.close()
+        return first, retry
+
+    first, retry = asyncio.run(main())
+    assert first == retry
+    assert printer.sent == ["^XAx^XZ"]
+
+
+def test_file_writes_happen_off_the_event_loop(tmp_path, monkeypatch):
+    path = str(tmp_path / "idempotency.jsonl")
+    cache = IdempotencyCache(max_entries=10, ttl=60, persist_path=path)
+    writer_threads = []
+    append = cache._append
+
+    def record_thread(line):
+        writer_threads.append(threading.current_thread())
+        append(line)
+
+    monkeypatch.setattr(cache, "_append", record_thread)
+
+    async def main():
+        await cache.run("k", "f", Counter())
+        return threading.current_thread()
+
+    loop_thread = asyncio.run(main())
+    cache.flush()
+    assert writer_threads and loop_thread not in writer_threads
+    with open(path, encoding="utf-8") as f:
+        assert [json.loads(line)["key"] for line in f] == ["k"]
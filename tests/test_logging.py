@@ -0,0 +1,89 @@
+import logging
+import threading
+
+import pytest
+from pydantic import ValidationError
+
+from app import logging_config
+from app.config import Settings
+from app.routers import print as print_router
+
+
+class RecordingHandler(logging.Handler):
+    """Guarda los mensajes y el hilo en que se escribieron"""
+
+    def __init__(self):
+        super().__init__()
+        self.records: list[tuple[str, threading.Thread]] = []
+        self.done = threading.Event()
+
+    def emit(self, record):
+        self.records.append((record.getMessage(), threading.current_thread()))
+        self.done.set()
+
+
+@pytest.fixture
+def clean_logging(monkeypatch):
+    """Estado de logging aislado: restaura root, uvicorn y los listeners al terminar"""
+    loggers = [logging.getLogger()] + [logging.getLogger(n) for n in logging_config.UVICORN_LOGGERS]
+    saved = [(lg, lg.handlers[:], lg.level, lg.propagate) for lg in loggers]
+    monkeypatch.setattr(logging_config, "_listeners", [])
+    monkeypatch.setattr(logging_config, "_root_configured", False)
+    yield
+    logging_config._stop_listeners()
+    for lg, handlers, level, propagate in saved:
+        lg.handlers = handlers
+        lg.level = level
+        lg.propagate = propagate
+
+
+def queue_handlers(logger):
+    return [h for h in logger.handlers if isinstance(h, logging_config._DeferredQueueHandler)]
+
+
+def test_setup_logging_runs_once(clean_logging):
+    logging_config.setup_logging("warning")
+    logging_config.setup_logging("DEBUG")
+    root = logging.getLogger()
+    assert len(queue_handlers(root)) == 1
+    assert root.level == logging.WARNING
+
+
+def test_uvicorn_handlers_write_from_the_listener_thread(clean_logging):
+    access = logging.getLogger("uvicorn.access")
+    handler = RecordingHandler()
+    access.handlers = [handler]
+    access.propagate = False
+    access.setLevel(logging.INFO)
+
+    logging_config.setup_logging("INFO")
+    logging_config.setup_logging("INFO")  # idempotente: no vuelve a envolver
+    assert access.handlers == queue_handlers(access)
+    assert len(access.handlers) == 1
+
+    access.info('"GET /health HTTP/1.1" %s', 200)
+    assert handler.done.wait(2)
+    [(message, thread)] = handler.records
+    assert message == '"GET /health HTTP/1.1" 200'
+    assert thread is not threading.current_thread()
+
+
+def test_request_log_sampling(monkeypatch):
+    settings = Settings()
+    monkeypatch.setattr(print_router, "get_settings", lambda: settings)
+    monkeypatch.setattr(print_router.logger, "isEnabledFor", lambda level: True)
+
+    settings.request_log_sample_rate = 0.0
+    assert not any(print_router._sample_request_log() for _ in range(100))
+    settings.request_log_sample_rate = 1.0
+    assert all(print_router._sample_request_log() for _ in range(100))
+
+    # Sin INFO habilitado no se muestrea (ni se formatea la petición)
+    monkeypatch.setattr(print_router.logger, "isEnabledFor", lambda level: False)
+    assert not print_router._sample_request_log()
+
+
+def test_log_level_is_validated():
+    assert Settings(log_level="debug").log_level == "DEBUG"
+    with pytest.raises(ValidationError, match="LOG_LEVEL"):
+        Settings(log_level="verbose")
@@ -0,0 +1,195 @@
+import asyncio
+import json
+
+import pytest
+
+from app.models.label import JobPriority
+from app.services import printer_owner
+from app.services.print_queue import DuplicateJobIdError, QueueFullError
+from app.services.printer_owner import JobTooLargeError, LocalPrintClient, RemotePrintClient
+
+from tests.conftest import FakePrinter
+
+
+def test_priority_order(make_dispatcher):
+    printer = FakePrinter()
+
+    async def main():
+        dispatcher = make_dispatcher(printer)
+        jobs = [
+            dispatcher.submit("^XAbulk^XZ", JobPriority.BULK, "a"),
+            dispatcher.submit("^XAnormal^XZ", JobPriority.NORMAL, "b"),
+            dispatcher.submit("^XAurgent^XZ", JobPriority.URGENT, "c"),
+        ]
+        await asyncio.gather(*(job.wait() for job in jobs))
+
+    asyncio.run(main())
+    assert printer.sent == ["^XAurgent^XZ", "^XAnormal^XZ", "^XAbulk^XZ"]
+
+
+def test_round_robin_between_clients(make_dispatcher):
+    printer = FakePrinter()
+
+    async def main():
+        dispatcher = make_dispatcher(printer)
+        jobs = [dispatcher.submit(f"^XAa{i}^XZ", JobPriority.BULK, "a") for i in range(3)]
+        jobs += [dispatcher.submit(f"^XAb{i}^XZ", JobPriority.BULK, "b") for i in range(2)]
+        await asyncio.gather(*(job.wait() for job in jobs))
+        return dispatcher.pending()
+
+    assert asyncio.run(main()) == 0
+    assert printer.sent == ["^XAa0^XZ", "^XAb0^XZ", "^XAa1^XZ", "^XAb1^XZ", "^XAa2^XZ"]
+
+
+def test_queue_full_per_client(make_dispatcher):
+    printer = FakePrinter()
+
+    async def main():
+        dispatcher = make_dispatcher(printer, max_per_client=2)
+        jobs = [dispatcher.submit("^XAa^XZ", client_id="a") for _ in range(2)]
+        with pytest.raises(QueueFullError):
+            dispatcher.submit("^XAa^XZ", client_id="a")
+        # El límite es por cliente: los demás siguen encolando
+        jobs.append(dispatcher.submit("^XAb^XZ", client_id="b"))
+        assert dispatcher.pending("a") == 2
+        assert dispatcher.pending() == 3
+        await asyncio.gather(*(job.wait() for job in jobs))
+        # Tras vaciarse la cola el cliente puede volver a encolar
+        await dispatcher.submit("^XAa^XZ", client_id="a").wait()
+
+    asyncio.run(main())
+    assert len(printer.sent) == 4
+
+
+def test_send_error_fails_job(make_dispatcher):
+    class BrokenPrinter(FakePrinter):
+        async def send_zpl(self, zpl_code):
+            raise OSError("conexión rechazada")
+
+    async def main():
+        dispatcher = make_dispatcher(BrokenPrinter())
+        with pytest.raises(Exception, match="conexión rechazada"):
+            await dispatcher.submit("^XAx^XZ").wait()
+        # El worker sigue vivo para los siguientes trabajos
+        dispatcher.printer = FakePrinter()
+        assert await dispatcher.submit("^XAy^XZ").wait()
+
+    asyncio.run(main())
+
+
+def test_local_client_returns_job_id(make_dispatcher):
+    async def main():
+        dispatcher = make_dispatcher(FakePrinter())
+        client = LocalPrintClient(dispatcher, dispatcher.events, None)
+        return await client.print_job("^XAx^XZ", JobPriority.NORMAL, "a", job_id="pedido-1")
+
+    assert asyncio.run(main()) == "pedido-1"
+
+
+def test_non_owner_forwards_to_owner(make_dispatcher, ownership):
+    printer = FakePrinter()
+
+    async def main():
+        dispatcher = make_dispatcher(printer, max_per_client=1)
+        owner, other = ownership(dispatcher)
+        owner_client = await owner.client()
+        remote_client = await other.client()
+        assert isinstance(owner_client, LocalPrintClient)
+        assert isinstance(remote_client, RemotePrintClient)
+
+        job_id = await remote_client.print_job("^XAremoto^XZ", JobPriority.URGENT, "a")
+        status = await remote_client.status()
+
+        # El límite por cliente se aplica en el dueño y vuelve como QueueFullError
+        printer.gate = asyncio.Event()
+        sending = dispatcher.submit("^XAb1^XZ", JobPriority.BULK, "b")
+        await asyncio.sleep(0.01)
+        queued = dispatcher.submit("^XAb2^XZ", JobPriority.BULK, "b")
+        with pytest.raises(QueueFullError):
+            await remote_client.print_job("^XAb3^XZ", JobPriority.BULK, "b")
+        printer.gate.set()
+        await asyncio.gather(sending.wait(), queued.wait())
+        owner._server.close()
+        return job_id, status
+
+    job_id, status = asyncio.run(main())
+    assert len(job_id) == 32
+    assert status == {"queued_jobs": 0, "printer_state": None}
+    assert printer.sent[0] == "^XAremoto^XZ"
+
+
+def test_large_job_is_forwarded_to_owner(make_dispatcher, ownership):
+    printer = FakePrinter()
+    # ^GFA de ~70 KB: por encima del límite de línea por defecto de asyncio (64 KiB)
+    zpl_code = "^XA^FO0,0^GFA,35000,35000,50," + "F0" * 35000 + "^FS^XZ"
+
+    async def main():
+        owner, other = ownership(make_dispatcher(printer))
+        await owner.client()
+        remote_client = await other.client()
+        job_id = await remote_client.print_job(zpl_code, JobPriority.NORMAL, "a")
+        owner._server.close()
+        return job_id
+
+    assert asyncio.run(main())
+    assert printer.sent == [zpl_code]
+
+
+def test_oversized_message_gets_an_explicit_reply(make_dispatcher, ownership, monkeypatch):
+    printer = FakePrinter()
+
+    async def main():
+        owner, other = ownership(make_dispatcher(printer))
+        await owner.client()
+        remote_client = await other.client()
+        # El dueño rechaza la línea y responde en vez de cortar la conexión
+        reader, writer = await asyncio.open_unix_connection(owner.socket_path)
+        writer.write(b"{not json}\n")
+        await writer.drain()
+        reply = json.loads(await reader.readline())
+        writer.close()
+        monkeypatch.setattr(printer_owner, "MAX_MESSAGE_BYTES", 1024)
+        with pytest.raises(JobTooLargeError):
+            await remote_client.print_job("^XA" + "x" * 2048 + "^XZ", JobPriority.NORMAL, "a")
+        owner._server.close()
+        return reply
+
+    reply = asyncio.run(main())
+    assert reply["ok"] is False and reply["error"] == "invalid"
+    assert printer.sent == []
+
+
+def test_concurrent_first_requests_elect_once(make_dispatcher, ownership):
+    async def main():
+        owner, _ = ownership(make_dispatcher(FakePrinter()))
+        first, second = await asyncio.gather(owner.client(), owner.client())
+        owner._server.close()
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert first is second
+    assert isinstance(first, LocalPrintClient)
+
+
+def test_duplicate_job_id_is_rejected_while_active(make_dispatcher, ownership):
+    printer = FakePrinter()
+
+    async def main():
+        dispatcher = make_dispatcher(printer)
+        owner, other = ownership(dispatcher)
+        await owner.client()
+        remote_client = await other.client()
+        printer.gate = asyncio.Event()
+        first = dispatcher.submit("^XAa^XZ", job_id="pedido-1")
+        with pytest.raises(DuplicateJobIdError):
+            dispatcher.submit("^XAb^XZ", job_id="pedido-1")
+        with pytest.raises(DuplicateJobIdError):
+            await remote_client.print_job("^XAb^XZ", JobPriority.NORMAL, "a", job_id="pedido-1")
+        printer.gate.set()
+        await first.wait()
+        # Terminado el trabajo, el id se puede reutilizar
+        await dispatcher.submit("^XAc^XZ", job_id="pedido-1").wait()
+        owner._server.close()
+
+    asyncio.run(main())
+    assert printer.sent == ["^XAa^XZ", "^XAc^XZ"]
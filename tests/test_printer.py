@@ -0,0 +1,58 @@
+import pytest
+
+from app.services.printer import HostStatus, PrinterStatusUnsupported
+
+# Respuestas ~HS tal como las envía la impresora: tres cadenas STX ... ETX CR LF
+IDLE = (
+    b"\x02030,0,0,0812,000,0,0,0,000,0,0,0\x03\r\n"
+    b"\x02001,0,0,0,1,2,4,0,00000000,1,000\x03\r\n"
+    b"\x021234,0\x03\r\n"
+)
+PRINTING = (
+    b"\x02030,0,0,0812,003,0,0,0,000,0,0,0\x03\r\n"
+    b"\x02001,0,0,0,1,2,4,0,00000005,1,000\x03\r\n"
+    b"\x021234,0\x03\r\n"
+)
+PAPER_OUT_PAUSED = (
+    b"\x02030,1,1,0812,001,1,0,0,000,0,0,0\x03\r\n"
+    b"\x02001,0,1,1,1,2,4,0,00000002,1,000\x03\r\n"
+    b"\x021234,0\x03\r\n"
+)
+
+
+def test_parse_idle():
+    status = HostStatus.parse(IDLE)
+    assert status.formats_in_buffer == 0
+    assert status.labels_remaining == 0
+    assert status.documents_pending == 0
+    assert not status.halted
+
+
+def test_parse_printing_counts_the_current_format():
+    status = HostStatus.parse(PRINTING)
+    assert status.formats_in_buffer == 3
+    assert status.labels_remaining == 5
+    assert status.documents_pending == 4
+
+
+def test_parse_error_flags():
+    status = HostStatus.parse(PAPER_OUT_PAUSED)
+    assert status.paper_out and status.paused and status.buffer_full
+    assert status.head_up and status.ribbon_out
+    assert status.halted
+
+
+def test_parse_without_third_string():
+    # Algunas impresoras compatibles solo devuelven las dos primeras cadenas
+    assert HostStatus.parse(IDLE.rsplit(b"\x02", 1)[0]).documents_pending == 0
+
+
+@pytest.mark.parametrize("raw", [
+    b"",
+    b"\x02030,0,0,0812,000,0,0,0,000,0,0,0\x03\r\n",
+    b"\x02OK\x03\x02READY\x03",
+    b"garbage",
+])
+def test_parse_rejects_unknown_replies(raw):
+    with pytest.raises(PrinterStatusUnsupported):
+        HostStatus.parse(raw)
@@ -0,0 +1,118 @@
+import asyncio
+import multiprocessing
+import os
+import socket
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.routers import print as print_router
+from app.services.printer import PrinterConnectionError, PrinterService
+from app.services.printer_lock import PrinterLease, PrinterLeaseTimeout, fcntl, lock_path
+
+pytestmark = pytest.mark.skipif(fcntl is None, reason="requiere flock")
+
+
+@pytest.fixture
+def listening_printer():
+    """Socket TCP local que acepta conexiones como lo haría la impresora"""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+    yield server.getsockname()
+    server.close()
+
+
+@pytest.fixture
+def service(tmp_path, listening_printer, monkeypatch):
+    host, port = listening_printer
+    printer = PrinterService(host, port)
+    printer.lock_dir = str(tmp_path)
+    printer.lock_timeout = 0.2
+    monkeypatch.setattr(PrinterService, "STATUS_LEASE_TIMEOUT", 0.2)
+    return printer
+
+
+def _hold_flock(path, ready, release):
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    ready.set()
+    release.wait(10)
+    os.close(fd)
+
+
+@pytest.fixture
+def lease_held_elsewhere(service):
+    """Otro proceso (otro worker) retiene el lease de la impresora"""
+    os.makedirs(service.lock_dir, exist_ok=True)
+    path = lock_path(service.lock_dir, service.host, service.port, "lock")
+    ready, release = multiprocessing.Event(), multiprocessing.Event()
+    holder = multiprocessing.Process(target=_hold_flock, args=(path, ready, release))
+    holder.start()
+    assert ready.wait(5)
+    yield
+    release.set()
+    holder.join(5)
+
+
+def test_lease_is_exclusive_across_processes(service, lease_held_elsewhere):
+    lease = PrinterLease(service.host, service.port, service.lock_dir, timeout=0.1)
+    with pytest.raises(PrinterLeaseTimeout):
+        lease.acquire()
+    # Un fallo no deja tomado el lock de hilo: el siguiente intento vuelve a esperar al flock
+    with pytest.raises(PrinterLeaseTimeout):
+        lease.acquire()
+
+
+def test_lease_is_released_after_use(service):
+    with PrinterLease(service.host, service.port, service.lock_dir, timeout=0.1):
+        pass
+    with PrinterLease(service.host, service.port, service.lock_dir, timeout=0.1):
+        pass
+
+
+def test_connection_status(service):
+    assert service.connection_status() == "online"
+    assert service.test_connection()
+
+
+def test_connection_status_busy_while_another_worker_holds_the_lease(service, lease_held_elsewhere):
+    assert service.connection_status() == "busy"
+    assert service.test_connection()
+
+
+def test_connection_status_offline(tmp_path):
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        host, port = probe.getsockname()
+    printer = PrinterService(host, port)
+    printer.lock_dir = str(tmp_path)
+    assert printer.connection_status() == "offline"
+    assert not printer.test_connection()
+
+
+def test_send_zpl_lease_timeout_is_a_connection_error(service, lease_held_elsewhere):
+    with pytest.raises(PrinterConnectionError, match="ocupada"):
+        asyncio.run(service.send_zpl("^XA^XZ"))
+
+
+def test_status_endpoint_reports_busy(service, lease_held_elsewhere, monkeypatch):
+    class FakeClient:
+        async def status(self):
+            return {"queued_jobs": 3, "printer_state": {"online": True, "paper_out": False}}
+
+    async def get_print_client():
+        return FakeClient()
+
+    monkeypatch.setattr(print_router, "PrinterService", lambda: service)
+    monkeypatch.setattr(print_router, "get_print_client", get_print_client)
+    app = FastAPI()
+    app.include_router(print_router.router)
+    with TestClient(app) as client:
+        body = client.get("/print/status").json()
+
+    assert body["status"] == "busy"
+    assert body["connected"] is True
+    assert body["queued_jobs"] == 3
+    assert body["printer_state"] == {"online": True, "paper_out": False}
@@ -0,0 +1,100 @@
+from app.services.text_layout import (
+    ELLIPSIS,
+    _ellipsize,
+    _split_word,
+    fit_text,
+    measure_many,
+    measure_texts,
+    text_width,
+    wrap_text,
+)
+
+
+def test_accented_letters_measure_like_their_base():
+    assert text_width("Ñandú", 30) == text_width("Nandu", 30)
+
+
+def test_measure_texts_matches_text_width():
+    [measured] = measure_texts(["uno dos\ntres"])
+    assert measured.paragraphs == [
+        [("uno", text_width("uno", 1000)), ("dos", text_width("dos", 1000))],
+        [("tres", text_width("tres", 1000))],
+    ]
+    assert measure_many(["uno", "tres"], 30) == [text_width("uno", 30), text_width("tres", 30)]
+
+
+def test_wrap_text_breaks_between_words():
+    lines = wrap_text("uno dos tres cuatro cinco", 30, 200)
+    assert lines == ["uno dos tres", "cuatro cinco"]
+    assert all(text_width(line, 30) <= 200 for line in lines)
+
+
+def test_wrap_text_keeps_paragraphs():
+    assert wrap_text("uno\n\ndos", 30, 200) == ["uno", "", "dos"]
+
+
+def test_split_word_uses_cumulative_widths():
+    word = "ABCDEFGHIJKLMNOPQRSTUVWXYZ" * 10
+    pieces = _split_word(word, 30, 200)
+    assert "".join(piece for piece, _ in pieces) == word
+    for piece, width in pieces:
+        assert width == text_width(piece, 30) <= 200
+    # Cada trozo es el más largo que cabe
+    for (piece, _), (following, _) in zip(pieces, pieces[1:]):
+        assert text_width(piece + following[0], 30) > 200
+
+
+def test_ellipsize_fits_the_block():
+    line = _ellipsize("cuatro cinco seis", 30, 200)
+    assert line.endswith(ELLIPSIS)
+    assert text_width(line, 30) <= 200
+    assert not line[:-len(ELLIPSIS)].endswith(" ")
+    # Si ya cabe, solo se añade la marca
+    assert _ellipsize("uno", 30, 200) == "uno" + ELLIPSIS
+
+
+def test_fit_text_without_shrink_truncates_with_ellipsis():
+    layout = fit_text("uno dos tres cuatro cinco seis siete ocho", 30, 30, 200, max_lines=2)
+    assert layout.truncated
+    assert len(layout.lines) == 2
+    assert layout.lines[-1].endswith(ELLIPSIS)
+    assert layout.font_size == 30
+    assert layout.height == 60
+
+
+def test_fit_text_that_fits_is_not_truncated():
+    layout = fit_text("corto", 30, 30, 200, max_lines=2)
+    assert layout.lines == ["corto"]
+    assert not layout.truncated
+
+
+def test_shrink_reduces_until_it_fits():
+    layout = fit_text("uno dos tres cuatro cinco seis", 60, 60, 300, max_lines=2, shrink=True, min_font_size=10)
+    assert layout.font_size < 60
+    assert len(layout.lines) <= 2 and not layout.truncated
+    assert layout.font_width == layout.font_size  # mantiene la proporción
+
+
+def test_shrink_prefers_a_smaller_font_to_splitting_words():
+    layout = fit_text("SUPERCALIFRAGILISTICEXPIALIDOCIOUSXYZ", 60, 72, 700, 2, True, 30)
+    assert layout.lines == ["SUPERCALIFRAGILISTICEXPIALIDOCIOUSXYZ"]
+    assert layout.font_size < 60
+
+
+def test_shrink_splits_words_only_at_min_font_size():
+    layout = fit_text("A" * 80, 60, 60, 300, max_lines=20, shrink=True, min_font_size=30)
+    assert layout.font_size == 30
+    assert len(layout.lines) > 1
+    assert "".join(layout.lines) == "A" * 80
+
+
+def test_shrink_at_min_font_size_still_truncates():
+    layout = fit_text("palabra " * 40, 60, 60, 300, max_lines=2, shrink=True, min_font_size=30)
+    assert layout.font_size == 30
+    assert layout.truncated
+    assert len(layout.lines) == 2
+
+
+def test_fit_text_accepts_measured_text():
+    [measured] = measure_texts(["uno dos tres cuatro"])
+    assert fit_text(measured, 30, 30, 200, max_lines=2) == fit_text("uno dos tres cuatro", 30, 30, 200, max_lines=2)
@@ -0,0 +1,102 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.models.label import LabelRequest, SimpleLabelRequest, TextAlignment, TextElement
+from app.routers import print as print_router
+from app.services.zpl_generator import ZPLGenerator
+
+
+def commands(zpl: str) -> list[str]:
+    return zpl.split("\n")
+
+
+def generate(*texts: TextElement) -> tuple[ZPLGenerator, list[str]]:
+    generator = ZPLGenerator()
+    zpl = generator.generate_from_request(LabelRequest(texts=list(texts)))
+    return generator, commands(zpl)
+
+
+def test_plain_text_has_no_field_block():
+    _, zpl = generate(TextElement(x=10, y=20, text="Hola", font_size=30))
+    assert zpl[zpl.index("^FO10,20") + 1:][:2] == ["^A0N,30,30", "^FDHola^FS"]
+    assert not any(c.startswith("^FB") for c in zpl)
+
+
+def test_bold_text_is_wider():
+    _, zpl = generate(TextElement(x=0, y=0, text="Hola", font_size=30, bold=True))
+    assert "^A0N,30,36" in zpl
+
+
+def test_alignment_uses_field_block_justification():
+    for alignment, code in ((TextAlignment.CENTER, "C"), (TextAlignment.RIGHT, "R")):
+        _, zpl = generate(TextElement(x=0, y=0, text="Hola", alignment=alignment, max_width=300))
+        assert f"^FB300,1,0,{code},0" in zpl
+
+
+def test_block_width_defaults_to_right_edge():
+    # 60 mm a 8 dots/mm = 480 dots
+    _, zpl = generate(TextElement(x=80, y=0, text="Hola", alignment=TextAlignment.CENTER))
+    assert "^FB400,1,0,C,0" in zpl
+
+
+def test_wrapped_lines_are_joined_with_line_breaks():
+    _, zpl = generate(TextElement(x=0, y=0, text="uno dos tres cuatro cinco", max_width=200, max_lines=3))
+    assert "^FB200,2,0,L,0" in zpl
+    assert "^FDuno dos tres\\&cuatro cinco^FS" in zpl
+
+
+def test_backslashes_are_escaped_in_field_blocks():
+    _, zpl = generate(TextElement(x=0, y=0, text="C:\\etiquetas", max_width=400))
+    assert "^FDC:\\\\etiquetas^FS" in zpl
+
+
+def test_truncated_text_is_reported():
+    generator, zpl = generate(
+        TextElement(x=0, y=0, text="uno dos tres cuatro cinco seis siete ocho", max_width=200, max_lines=2),
+        TextElement(x=0, y=100, text="corto", max_width=200),
+    )
+    assert len(generator.warnings) == 1
+    assert "2 línea(s) de 200 dots" in generator.warnings[0]
+    assert any(c.startswith("^FD") and c.endswith("...^FS") for c in zpl)
+
+
+def test_warnings_are_reset_between_labels():
+    generator = ZPLGenerator()
+    generator.generate_from_request(LabelRequest(texts=[
+        TextElement(x=0, y=0, text="uno dos tres cuatro cinco seis", max_width=100),
+    ]))
+    assert generator.warnings
+    generator.generate_from_request(LabelRequest(texts=[TextElement(x=0, y=0, text="ok")]))
+    assert generator.warnings == []
+
+
+def test_simple_label_advances_by_measured_height():
+    zpl = commands(ZPLGenerator().generate_simple_label(SimpleLabelRequest(
+        title="Café con leche muy largo para la etiqueta pequeña",
+        subtitle="Sub",
+        label_size="small",
+    )))
+    title = zpl.index("^FO50,30")
+    font = zpl[title + 1]
+    title_size = int(font.split(",")[1])
+    title_lines = int(zpl[title + 2].split(",")[1])
+    assert title_size < 60  # se redujo para caber en 2 líneas
+    assert f"^FO50,{30 + title_lines * title_size + 10}" in zpl
+
+
+def test_simple_label_short_title_keeps_full_size():
+    zpl = commands(ZPLGenerator().generate_simple_label(SimpleLabelRequest(title="Hola", subtitle="Mundo")))
+    assert "^A0N,60,72" in zpl
+    assert "^FO50,100" in zpl  # 30 + 60 + 10
+
+
+def test_preview_response_includes_warnings():
+    app = FastAPI()
+    app.include_router(print_router.router)
+    with TestClient(app) as client:
+        response = client.post(
+            "/print/label?preview_only=true",
+            json={"texts": [{"x": 0, "y": 0, "text": "uno dos tres cuatro cinco seis", "max_width": 100}]},
+        )
+    assert response.status_code == 200
+    assert len(response.json()["warnings"]) == 1